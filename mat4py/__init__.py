@@ -3,10 +3,47 @@
 This module provides the following two functions for loading and saving
 data in Matlab (TM) MAT-file format:
 
-    data = loadmat(filename, meta=False)
+    data = loadmat(filename, meta=False, variable_names=None, backend='list')
 
     savemat(filename, data)
 
+MAT-files in memory are loaded from, and saved to, bytes with:
+
+    data = loads(buffer)
+
+    buffer = dumps(data)
+
+Variables can be read one at a time, for processing large files with
+constant memory use, using the generator function:
+
+    for name, value in iter_variables(filename):
+        ...
+
+Many MAT-files can be loaded in a pool of worker processes, using:
+
+    for path, data, error in loadmat_many(paths, workers=None):
+        ...
+
+The variables stored in a MAT-file can be listed, without loading any
+array data, using the function:
+
+    variables = whosmat(filename)
+
+Loaded variables can be cached on disk, for files that are loaded again:
+
+    data = loadmat(filename, cache=mat4py.cache.DiskCache(directory))
+
+A sidecar index file, with the offsets of the variables, can be written
+for fast random access to the variables of large files:
+
+    write_index(filename)
+
+The class ``MatFile`` gives read-only dict like access to the variables in
+a MAT-file, loading each variable on first access:
+
+    with MatFile(filename) as mf:
+        x = mf['x']
+
 The function ``loadmat`` loads all variables stored in the MAT-file into
 a simple Python data structure, using only Python's dict and list
 objects. Numeric and cell arrays are converted to row-ordered nested lists.
@@ -14,25 +51,38 @@ Arrays are squeezed to eliminate arrays with only one element.
 The resulting data structure is composed of simple types that are compatible
 with the JSON format.
 
+With parameter backend='array', numeric arrays are instead loaded as compact
+``NumericArray`` objects, holding the values in a column-major
+``array.array`` together with the array dimensions.
+Sparse matrices are loaded as ``SparseMatrix`` objects, in compressed sparse
+column format. With backend='numpy',
+numeric arrays are loaded as NumPy arrays (NumPy is an optional dependency).
+Numeric arrays may have any number of dimensions, and complex values.
+With columnar=True, struct vectors are loaded as ``StructColumns`` objects,
+with one (typed) column per field.
+
 Python data can be saved to a MAT-file, with the function ``savemat``. Data has
 to be structured in the same way as for ``loadmat``, i.e. it should be composed
 of simple data types, like dict, list, str, int and float.
 
 The following Matlab data structures/types are not supported:
 
-* Arrays with more than 2 dimensions
-* Arrays with complex numbers
-* Sparse arrays
 * Function arrays
 * Object classes
 * Anonymous function classes
 
 """
-from .loadmat import loadmat
-from .savemat import savemat
+from .arrays import NumericArray, SparseMatrix, StructColumns
+from .batch import loadmat_many
+from .loadmat import (ParseError, iter_variables, loadmat, loads, whosmat,
+                      write_index)
+from .matfile import MatFile
+from .savemat import dumps, savemat
 
 __version__ = '0.6.0'
-__all__ = ['loadmat', 'savemat']
+__all__ = ['loadmat', 'savemat', 'loads', 'dumps', 'iter_variables',
+           'loadmat_many', 'whosmat', 'write_index', 'MatFile',
+           'NumericArray', 'SparseMatrix', 'StructColumns', 'ParseError']
 __license__ = """The MIT License (MIT), Copyright (c) 2011-2023 Nephics AB"""
 
 
@@ -0,0 +1,138 @@
+"""asyncio interface for loading and saving data in the Matlab (TM) MAT-file
+format
+
+The coroutines ``loadmat`` and ``savemat`` of this module run the file I/O,
+and the compression and decompression of data, in an executor, one variable
+at a time, so that the event loop is not blocked while a file is processed:
+
+    data = await mat4py.aio.loadmat(filename)
+
+    await mat4py.aio.savemat(filename, data)
+
+Copyright (c) 2011-2023 Nephics AB
+The MIT License (MIT)
+"""
+
+__all__ = ['loadmat', 'savemat']
+
+
+import asyncio
+
+from collections.abc import Mapping
+
+from .loadmat import iter_variables
+from .savemat import write_compressed_var_array, write_file_header
+
+
+async def limited(semaphore, coro):
+    """Await coro, holding semaphore (if not None) while doing so."""
+    if semaphore is None:
+        return await coro
+    async with semaphore:
+        return await coro
+
+
+async def call(executor, func, *args):
+    """Run func(*args) in executor, and return the result.
+
+    If the awaiting task is cancelled, the call is waited for before the
+    ``CancelledError`` is raised, so that the file it uses is not closed
+    while it runs (a call in progress cannot be interrupted).
+    """
+    future = asyncio.get_running_loop().run_in_executor(executor, func, *args)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        while not future.done():
+            try:
+                await asyncio.wait([future])
+            except asyncio.CancelledError:
+                pass
+        raise
+
+
+def close(variables, fd):
+    """Close the variables generator and the file (either may be None)."""
+    try:
+        if variables is not None:
+            variables.close()
+    finally:
+        if fd is not None:
+            fd.close()
+
+
+async def loadmat(filename, meta=False, variable_names=None, backend='list',
+                  order='C', executor=None, semaphore=None):
+    """Load data from MAT-file:
+
+    data = await loadmat(filename, meta=False, variable_names=None,
+                         backend='list', order='C', executor=None,
+                         semaphore=None)
+
+    The coroutine reads the variables one at a time in the executor (the
+    default executor of the event loop, if None), and returns control to
+    the event loop between variables.
+
+    Give an ``asyncio.Semaphore`` shared between calls, as the semaphore
+    argument, to limit the number of files loaded or saved concurrently.
+
+    The other arguments, and the returned data, are as for
+    ``mat4py.loadmat``.
+    """
+    return await limited(semaphore, read_variables(
+        filename, meta, variable_names, backend, order, executor))
+
+
+async def read_variables(filename, meta, variable_names, backend, order,
+                         executor):
+    mdict = {}
+    # the file is opened by the generator, when the first variable is read
+    # meta data is stored directly in the returned dict
+    variables = iter_variables(filename, variable_names, backend, order,
+                               mdict if meta else None)
+    try:
+        while True:
+            item = await call(executor, next, variables, None)
+            if item is None:
+                break
+            name, value = item
+            mdict[name] = value
+    finally:
+        await call(executor, close, variables,
+                   filename if not isinstance(filename, str) else None)
+    return mdict
+
+
+async def savemat(filename, data, executor=None, semaphore=None):
+    """Save data to MAT-file:
+
+    await savemat(filename, data, executor=None, semaphore=None)
+
+    The coroutine writes the variables one at a time in the executor (the
+    default executor of the event loop, if None), and returns control to
+    the event loop between variables.
+
+    Give an ``asyncio.Semaphore`` shared between calls, as the semaphore
+    argument, to limit the number of files loaded or saved concurrently.
+
+    The other arguments are as for ``mat4py.savemat``.
+    """
+    if not isinstance(data, Mapping):
+        raise ValueError('Data should be a dict of variable arrays')
+    return await limited(semaphore,
+                         write_variables(filename, data, executor))
+
+
+async def write_variables(filename, data, executor):
+    if isinstance(filename, str):
+        fd = await call(executor, open, filename, 'wb')
+    else:
+        fd = filename
+
+    try:
+        await call(executor, write_file_header, fd)
+        # write variables
+        for name, array in data.items():
+            await call(executor, write_compressed_var_array, fd, array, name)
+    finally:
+        await call(executor, close, None, fd)
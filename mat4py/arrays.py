@@ -0,0 +1,294 @@
+"""compact array types for data in the Matlab (TM) MAT-file format
+
+Copyright (c) 2011-2023 Nephics AB
+The MIT License (MIT)
+"""
+
+__all__ = ['NumericArray', 'SparseMatrix', 'StructColumns']
+
+
+import array
+from itertools import chain
+
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence
+try:
+    basestring
+except NameError:
+    basestring = str
+
+
+class NumericArray(object):
+    """Numeric array stored as a flat ``array.array`` in column-major
+    (Matlab) order, together with the array dimensions (two or more).
+
+    This is a compact alternative to nested lists: the values are held as
+    machine types in a single buffer, rather than as one Python object per
+    element.
+
+    For complex arrays, the imaginary part is held in a second
+    ``array.array``, ``imag``, of the same length as ``data``.
+
+    The Matlab class of the array, e.g. 'mxDOUBLE_CLASS', is given by
+    ``mclass`` (None for the class of the data type), as Matlab may store
+    the values in a smaller data type, e.g. a double matrix of small
+    integers as uint8 values. Logical arrays have ``is_logical`` set.
+    """
+
+    def __init__(self, data, dims, imag=None, mclass=None, is_logical=False):
+        self.data = data
+        self.dims = tuple(dims)
+        self.imag = imag
+        self.mclass = mclass
+        self.is_logical = is_logical
+
+    @classmethod
+    def from_lists(cls, lists):
+        """Create a numeric array from row-major nested lists of numbers,
+        of any number of dimensions, as returned by ``loadmat``.
+
+        Integer values are stored as int32 values (int64 values if needed),
+        other values as doubles. Raises ``ValueError`` if the lists are not
+        uniformly nested, or hold other values than numbers.
+        """
+        dims = []
+        values = lists
+        while isinstance(values, Sequence) and \
+                not isinstance(values, basestring):
+            dims.append(len(values))
+            values = values[0] if values else None
+        if not dims or not is_nested(lists, dims):
+            raise ValueError('Not uniformly nested lists of numbers')
+        for i in range(len(dims) - 1):
+            lists = list(chain.from_iterable(lists))
+        values = column_major(lists, dims)
+        if len(dims) == 1:
+            dims.insert(0, 1)
+        if any(isinstance(v, complex) for v in values):
+            return cls(array.array('d', [complex(v).real for v in values]),
+                       dims,
+                       array.array('d', [complex(v).imag for v in values]))
+        if all(isinstance(v, int) for v in values):
+            limit = max(values or [0], key=abs)
+            typecode = 'i' if -2 ** 31 <= limit < 2 ** 31 else 'q'
+            return cls(array.array(typecode, values), dims)
+        return cls(array.array('d', values), dims)
+
+    @property
+    def is_complex(self):
+        """True if the array has an imaginary part."""
+        return self.imag is not None
+
+    @property
+    def typecode(self):
+        """The ``array.array`` type code of the values."""
+        return self.data.typecode
+
+    def tolist(self):
+        """Return the matrix as row-major nested lists, squeezed in the
+        same way as the arrays returned by ``loadmat``.
+        """
+        data = self.data
+        if self.imag is not None:
+            data = [complex(r, i) for r, i in zip(data, self.imag)]
+        if len(data) == 1:
+            # not an array, just a value
+            return data[0]
+        return squeeze(nested_lists(data, self.dims))
+
+    def __eq__(self, other):
+        if not isinstance(other, NumericArray):
+            return NotImplemented
+        return (self.dims == other.dims and self.data == other.data and
+                self.imag == other.imag)
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    def __repr__(self):
+        if self.imag is not None:
+            return 'NumericArray({!r}, {!r}, {!r})'.format(
+                self.data, self.dims, self.imag)
+        return 'NumericArray({!r}, {!r})'.format(self.data, self.dims)
+
+
+def squeeze(array):
+    """Return array contents if array contains only one element.
+    Otherwise, return the full array.
+    """
+    if len(array) == 1:
+        array = array[0]
+    return array
+
+
+def is_nested(lists, dims):
+    """Return True if lists are nested lists of numbers, with dimensions
+    dims."""
+    if not dims:
+        return isinstance(lists, (int, float, complex))
+    return (isinstance(lists, Sequence) and
+            not isinstance(lists, basestring) and len(lists) == dims[0] and
+            all(is_nested(v, dims[1:]) for v in lists))
+
+
+def column_major(data, dims):
+    """Return the values of the row-major sequence data of an array with
+    dimensions dims, in column-major order (the inverse of
+    ``nested_lists``, for flattened lists)."""
+    if len(dims) == 1:
+        return list(data)
+    # the sub-array at index i of the last dimension is strided in data
+    return list(chain.from_iterable(
+        column_major(data[i::dims[-1]], dims[:-1]) for i in range(dims[-1])))
+
+
+def nested_lists(data, dims, order='C'):
+    """Convert the column-major sequence data of an array with dimensions
+    dims to nested lists.
+
+    With order='C', the nesting follows the dimensions (the outer list is
+    indexed by the first dimension, i.e. a matrix is a list of rows).
+    With order='F', the nesting is reversed (the outer list is indexed by
+    the last dimension, i.e. a matrix is a list of columns).
+    """
+    if len(dims) == 1:
+        return list(data)
+    if order == 'F':
+        size = len(data) // dims[-1] if dims[-1] else 0
+        return [nested_lists(data[i * size:(i + 1) * size], dims[:-1], 'F')
+                for i in range(dims[-1])]
+    # the sub-array at index i of the first dimension is strided in data
+    return [nested_lists(data[i::dims[0]], dims[1:]) for i in range(dims[0])]
+
+
+class SparseMatrix(object):
+    """Sparse matrix in compressed sparse column (CSC) format, as stored in
+    MAT-files:
+
+    * ``dims``: tuple with the matrix dimensions
+    * ``indices``: the row index of each value
+    * ``indptr``: for each column, the position in indices and data of the
+      column's first value, followed by the number of values
+    * ``data``: the non-zero values, column by column
+
+    The index and value arrays are ``array.array`` objects (or any
+    sequences), so memory use is proportional to the number of non-zero
+    values.
+    """
+
+    def __init__(self, dims, indices, indptr, data):
+        self.dims = tuple(dims)
+        self.indices = indices
+        self.indptr = indptr
+        self.data = data
+
+    @classmethod
+    def from_coo(cls, dims, rows, cols, values):
+        """Create a sparse matrix from coordinate (COO) format, i.e. from
+        sequences with the row index, column index and value of each
+        non-zero element. Elements may be given in any order, but each
+        (row, col) index should be given only once.
+        """
+        order = sorted(range(len(values)), key=lambda i: (cols[i], rows[i]))
+        # count values per column, and accumulate to column pointers
+        indptr = array.array('i', [0]) * (dims[1] + 1)
+        for col in cols:
+            indptr[col + 1] += 1
+        for col in range(dims[1]):
+            indptr[col + 1] += indptr[col]
+        indices = array.array('i', (rows[i] for i in order))
+        data = array.array('d', (values[i] for i in order))
+        return cls(dims, indices, indptr, data)
+
+    @property
+    def nnz(self):
+        """The number of stored values."""
+        return len(self.data)
+
+    def todok(self):
+        """Return a dict mapping (row, col) index tuples to values."""
+        dok = {}
+        for col in range(self.dims[1]):
+            for i in range(self.indptr[col], self.indptr[col + 1]):
+                dok[(self.indices[i], col)] = self.data[i]
+        return dok
+
+    def toscipy(self):
+        """Return the matrix as a ``scipy.sparse.csc_matrix``
+        (requires SciPy).
+        """
+        from scipy.sparse import csc_matrix
+        return csc_matrix((self.data, self.indices, self.indptr),
+                          shape=self.dims)
+
+    def __eq__(self, other):
+        if not isinstance(other, SparseMatrix):
+            return NotImplemented
+        return (self.dims == other.dims and
+                list(self.indices) == list(other.indices) and
+                list(self.indptr) == list(other.indptr) and
+                list(self.data) == list(other.data))
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    def __repr__(self):
+        return 'SparseMatrix({!r}, {!r}, {!r}, {!r})'.format(
+            self.dims, self.indices, self.indptr, self.data)
+
+
+def typed_values(values, typecode):
+    """Return the sequence of values as an array of the given type code,
+    supporting the buffer protocol. Arrays of the given type, and NumPy
+    arrays of the corresponding data type, are returned as is.
+    """
+    if isinstance(values, array.array):
+        if values.typecode == typecode:
+            return values
+    elif hasattr(values, 'astype'):
+        # NumPy array
+        return values.astype(typecode, copy=False)
+    return array.array(typecode, values)
+
+
+class StructColumns(Mapping):
+    """Struct array (of dimensions 1xN or Nx1) stored as one column per
+    field, i.e. as a struct of arrays rather than an array of structs.
+
+    The mapping has the field names as keys, and a column with the values
+    of all the elements of the struct array as values. Fields with numeric
+    scalar values of the same class in all elements are held as compact
+    typed columns (an ``array.array``, or a NumPy array with the 'numpy'
+    backend), other fields as lists of values.
+    """
+
+    def __init__(self, dims, columns):
+        self.dims = tuple(dims)
+        self.columns = columns
+
+    def __getitem__(self, field):
+        return self.columns[field]
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def element(self, index):
+        """Return a dict with the field values of element index."""
+        return dict((f, c[index]) for f, c in self.columns.items())
+
+    def todict(self):
+        """Return a dict with a list of values per field, as returned by
+        ``loadmat`` for a struct array when not read as columns.
+        """
+        return dict((f, c.tolist() if hasattr(c, 'tolist') else list(c))
+                    for f, c in self.columns.items())
+
+    def __repr__(self):
+        return 'StructColumns({!r}, {!r})'.format(self.dims, self.columns)
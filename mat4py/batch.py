@@ -0,0 +1,104 @@
+"""load batches of files in the Matlab (TM) MAT-file format
+
+Copyright (c) 2011-2023 Nephics AB
+The MIT License (MIT)
+"""
+
+__all__ = ['loadmat_many']
+
+
+import multiprocessing
+from collections import deque
+from itertools import islice
+
+try:
+    from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                    wait)
+except ImportError:
+    ProcessPoolExecutor = None
+
+from .loadmat import loadmat
+
+
+def load_chunk(paths, options):
+    """Load a chunk of MAT-files, in a worker process.
+
+    Returns a list with a tuple (path, data, error) for each file, where
+    error is the exception raised when loading the file, or None.
+    """
+    results = []
+    for path in paths:
+        try:
+            results.append((path, loadmat(path, **options), None))
+        except Exception as e:
+            results.append((path, None, e))
+    return results
+
+
+def chunked(iterable, size):
+    """Split an iterable into lists of at most size items."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def loadmat_many(paths, workers=None, variable_names=None, ordered=True,
+                 chunksize=16, meta=False, backend='list', order='C'):
+    """Load data from many MAT-files, using a pool of worker processes:
+
+    for path, data, error in loadmat_many(paths, workers=None, ...):
+        ...
+
+    The paths argument is an iterable of MAT-file names. The files are
+    loaded with ``loadmat`` in a pool of (at most) workers processes, which
+    defaults to the number of processors on the machine.
+
+    The function returns a generator, yielding a tuple (path, data, error)
+    for each file. If the file was loaded, data is the dict returned by
+    ``loadmat``, and error is None. Otherwise, data is None and error is
+    the exception raised (typically a ``ParseError``), and the remaining
+    files are still loaded.
+
+    With ordered=True, results are generated in the order of the paths.
+    With ordered=False, results are generated as they are completed.
+
+    Paths are submitted to the workers in chunks of chunksize files, so that
+    the cost of inter-process communication is shared by several (small)
+    files. At most two chunks per worker are submitted ahead of the results
+    generated, and the chunks not yet started are cancelled if the generator
+    is closed early (e.g. on ``break``).
+
+    The parameters variable_names, meta, backend and order are passed on
+    to ``loadmat``.
+    """
+    if ProcessPoolExecutor is None:
+        raise RuntimeError('Batch loading requires concurrent.futures')
+    options = {'meta': meta, 'variable_names': variable_names,
+               'backend': backend, 'order': order}
+    chunks = chunked(paths, chunksize)
+    # limit the number of chunks submitted ahead, so that few files are
+    # loaded in vain if the generator is closed early
+    window = 2 * (workers or multiprocessing.cpu_count())
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque(executor.submit(load_chunk, chunk, options)
+                        for chunk in islice(chunks, window))
+        try:
+            while pending:
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    done = wait(pending, return_when=FIRST_COMPLETED).done
+                    for f in done:
+                        pending.remove(f)
+                for f in done:
+                    for result in f.result():
+                        yield result
+                for chunk in islice(chunks, len(done)):
+                    pending.append(
+                        executor.submit(load_chunk, chunk, options))
+        finally:
+            for f in pending:
+                f.cancel()
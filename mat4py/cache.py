@@ -0,0 +1,284 @@
+"""caches of variables loaded from Matlab (TM) MAT-files
+
+Copyright (c) 2011-2023 Nephics AB
+The MIT License (MIT)
+"""
+
+__all__ = ['DiskCache', 'VariableCache']
+
+
+import hashlib
+import mmap
+import os
+import pickle
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+# number of bytes hashed at the start and end of a file, for its identity
+SAMPLE_SIZE = 64 * 1024
+
+
+def file_identity(path):
+    """Return a tuple identifying the contents of the file at path: the
+    absolute path, the size and modification time of the file, and a hash
+    of the first and last SAMPLE_SIZE bytes of the file.
+
+    The file is not hashed in full, as that would cost about as much as
+    loading it.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fd:
+        digest.update(fd.read(SAMPLE_SIZE))
+        if stat.st_size > SAMPLE_SIZE:
+            fd.seek(max(SAMPLE_SIZE, stat.st_size - SAMPLE_SIZE))
+            digest.update(fd.read(SAMPLE_SIZE))
+    mtime = getattr(stat, 'st_mtime_ns', stat.st_mtime)
+    return (path, stat.st_size, mtime, digest.hexdigest())
+
+
+def copy_containers(value):
+    """Return a copy of the lists and dicts in value (recursively), sharing
+    the other (immutable, or array) values they hold."""
+    if isinstance(value, list):
+        return [copy_containers(v) for v in value]
+    if isinstance(value, dict):
+        return dict((k, copy_containers(v)) for k, v in value.items())
+    return value
+
+
+def estimate_size(value):
+    """Return an estimate of the memory footprint of value, in bytes,
+    including the values it contains."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v)
+                    for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(estimate_size(v) for v in value)
+    elif hasattr(value, 'nbytes'):
+        # NumPy array, count the data of views too
+        size = max(size, value.nbytes)
+    elif hasattr(value, '__dict__'):
+        # e.g. NumericArray, SparseMatrix or StructColumns
+        size += estimate_size(vars(value))
+    return size
+
+
+def check_private(directory):
+    """Raise ValueError if directory is owned by another user, or writable
+    by the group or others (on systems with file ownership)."""
+    if not hasattr(os, 'getuid'):
+        return
+    stat = os.stat(directory)
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o022:
+        raise ValueError('Cache directory {} is not private to the user'
+                         .format(directory))
+
+
+class VariableCache(object):
+    """In-process cache of loaded variables, with a memory budget:
+
+    cache = VariableCache(max_bytes=256 * 2 ** 20)
+    data = loadmat(filename, cache=cache)
+
+    The cache holds the least recently used variables, up to an estimated
+    total memory footprint of max_bytes (see ``estimate_size``). It may be
+    shared by several threads, and by ``loadmat``, ``iter_variables`` and
+    ``MatFile`` objects (with the same keys as ``DiskCache``).
+
+    The lists and dicts of a value are copied when it is stored and when it
+    is returned, so that callers may modify them without affecting the
+    cache. Other objects, like ``NumericArray`` objects and NumPy arrays,
+    are shared between the callers, and should not be modified.
+
+    The counters ``hits``, ``misses`` and ``evictions`` count the calls to
+    ``get`` that found resp. did not find a value, and the values removed
+    to keep within the memory budget.
+    """
+
+    def __init__(self, max_bytes=256 * 2 ** 20):
+        self.max_bytes = max_bytes
+        # values and sizes, in order of use (most recently used last)
+        self.items = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value of key, or None if not cached."""
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+        return copy_containers(item[0])
+
+    def set(self, key, value):
+        """Store the value of key in the cache, and remove the least recently
+        used values if the cache is full."""
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        value = copy_containers(value)
+        with self.lock:
+            item = self.items.pop(key, None)
+            if item is not None:
+                self.total_bytes -= item[1]
+            self.items[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                key, item = self.items.popitem(last=False)
+                self.total_bytes -= item[1]
+                self.evictions += 1
+
+    def stats(self):
+        """Return a dict with the counters, the number of cached values,
+        and their estimated total size."""
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'entries': len(self.items),
+                    'total_bytes': self.total_bytes}
+
+    def clear(self):
+        """Remove all cached values (the counters are kept)."""
+        with self.lock:
+            self.items.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self.items)
+
+
+class DiskCache(object):
+    """Persistent cache of loaded variables, stored in a directory:
+
+    cache = DiskCache(directory, max_bytes=2 ** 30)
+    data = loadmat(filename, cache=cache)
+
+    Each variable is stored as a pickle file, named by a hash of its key.
+    The keys used by ``loadmat`` identify the MAT-file by path, size,
+    modification time and a hash of its contents (see ``file_identity``),
+    together with the variable name and the options it was loaded with, so
+    a modified file is never served from the cache.
+
+    Cached values are read through a memory map of the pickle file. The
+    total size of the cache files is kept below max_bytes, by removing the
+    least recently used files when a value is added. The cache directory
+    may be shared by several processes of the same user.
+
+    As unpickling a file can execute arbitrary code, the cache directory
+    must only be writable by trusted users. The directory is created
+    private to the user (mode 0o700), and a ``ValueError`` is raised for
+    an existing directory owned by another user, or writable by others.
+    """
+
+    suffix = '.pickle'
+
+    def __init__(self, directory, max_bytes=2 ** 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        check_private(directory)
+        # total size of the cache files (updated by this process only)
+        self.total_bytes = sum(size for path, size, mtime in self.entries())
+
+    def path(self, key):
+        """Return the path of the cache file of key."""
+        name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + self.suffix)
+
+    def entries(self):
+        """Return a list with a tuple (path, size, mtime) for each cache
+        file."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # removed by another process
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def get(self, key):
+        """Return the cached value of key, or None if not cached."""
+        path = self.path(key)
+        try:
+            fd = open(path, 'rb')
+        except (IOError, OSError):
+            return None
+        with fd:
+            try:
+                data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # empty file
+                return None
+            try:
+                value = pickle.loads(data)
+            except Exception:
+                # corrupt cache file
+                value = None
+            finally:
+                data.close()
+        try:
+            if value is None:
+                os.remove(path)
+            else:
+                # mark as recently used
+                os.utime(path, None)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value):
+        """Store the value of key in the cache, and remove the least recently
+        used values if the cache is full."""
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        # write to a temporary file, and move it in place
+        fileno, tempname = tempfile.mkstemp(suffix='.tmp',
+                                            dir=self.directory)
+        with os.fdopen(fileno, 'wb') as fd:
+            fd.write(data)
+        os.replace(tempname, self.path(key))
+        self.total_bytes += len(data)
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used cache files, until the total
+        size is at most max_bytes."""
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        total = sum(size for path, size, mtime in entries)
+        for path, size, mtime in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self.total_bytes = total
+
+    def clear(self):
+        """Remove all cache files."""
+        for path, size, mtime in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.total_bytes = 0
@@ -1,6 +1,7 @@
 """Command line utility for mat4py.
 
-Provides a routine for converting Matlab MAT-files to/from JSON files.
+Provides a routine for converting Matlab MAT-files to/from JSON files,
+and for writing sidecar index files of MAT-files.
 
 Call
 
@@ -14,7 +15,7 @@ import json
 import os
 import sys
 
-from mat4py import loadmat, savemat
+from mat4py import loadmat, savemat, write_index
 
 
 def main():
@@ -35,13 +36,24 @@ def main():
     parser.add_argument(
         '-f', '--force', action='store_const', const=True,
         default=False, help='overwrite existing files when converting')
+    parser.add_argument(
+        '-i', '--index', action='store_const', const=True,
+        default=False, help='write a sidecar index file (.matidx) for each '
+        'MAT-file, instead of converting it')
     args = parser.parse_args()
 
     for path in args.file:
         spl = os.path.splitext(path)
         ext = spl[1].lower()
 
-        if ext == '.mat':
+        if ext == '.mat' and args.index:
+            try:
+                write_index(path)
+            except Exception as e:
+                print('Error: {}'.format(e))
+                sys.exit(1)
+
+        elif ext == '.mat':
             dest = spl[0] + '.json'
             try:
                 if os.path.exists(dest) and not args.force:
@@ -4,19 +4,28 @@ Copyright (c) 2011-2023 Nephics AB
 The MIT License (MIT)
 """
 
-__all__ = ['loadmat']
+__all__ = ['loadmat', 'loads', 'iter_variables', 'whosmat', 'write_index']
 
 
+import array
+import json
+import os
 import struct
 import sys
 import zlib
 
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
 try:
     from collections.abc import Sequence
 except ImportError:
     from collections import Sequence
 
-from itertools import tee
+from collections import deque
+from itertools import islice, tee
 try:
     from itertools import izip
     ispy2 = True
@@ -24,8 +33,21 @@ except ImportError:
     izip = zip
     basestring = str
     ispy2 = False
+try:
+    intern
+except NameError:
+    from sys import intern
 from io import BytesIO
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .arrays import (NumericArray, SparseMatrix, StructColumns, nested_lists,
+                     squeeze)
+from .cache import file_identity
+
 
 # encode a string to bytes and vice versa
 asbytes = lambda s: s.encode('latin1')
@@ -91,9 +113,30 @@ numeric_class_etypes = {
 
 inv_mclasses = dict((v, k) for k, v in mclasses.items())
 
+# data types that may be used for char data
+char_etypes = ['miUTF8', 'miUTF16', 'miUTF32', 'miUINT16', 'miUINT8', 'miINT8']
+
 # data types that may be used when writing numeric data
 compressed_numeric = ['miINT32', 'miUINT16', 'miINT16', 'miUINT8']
 
+# number of bytes read from file per step, when inflating compressed data
+CHUNK_SIZE = 64 * 1024
+
+# file name extension and format version of sidecar index files
+INDEX_EXT = '.matidx'
+INDEX_VERSION = 1
+
+# output representations of numeric arrays
+backends = ('list', 'array', 'numpy')
+
+# default options for reading variable arrays
+default_options = {
+    'backend': 'list',
+    'order': 'C',
+    'columnar': False,
+    'intern': False
+}
+
 
 def diff(iterable):
     """Diff elements of a sequence:
@@ -108,22 +151,63 @@ def diff(iterable):
 # Uitlity functions
 #
 
+class Codec(object):
+    """Precompiled struct formats for unpacking data of one byte order.
+
+    Holds Struct objects for the data element tags and the array flags,
+    and caches the Struct objects used for unpacking (short) arrays of
+    values, to avoid building format strings for each element read.
+    """
+
+    # max number of values for which array Struct objects are cached
+    max_cached = 64
+
+    def __init__(self, endian):
+        self.endian = endian
+        # data element tag: type and number of bytes
+        self.tag = struct.Struct(endian + 'II')
+        # array flags element: tag, and flags and nzmax values
+        self.flags = struct.Struct(endian + 'IIII')
+        # header of a matrix with two dimensions and an empty name: array
+        # flags, dimensions and name elements, followed by the data tag
+        self.matrix = struct.Struct(endian + '12I')
+        self.sizes = dict(
+            (v['fmt'], struct.calcsize(endian + v['fmt']))
+            for v in etypes.values() if v.get('fmt', 's') != 's')
+        self.structs = {}
+
+    def get_struct(self, fmt, num):
+        """Return a Struct for unpacking num values of format fmt."""
+        key = (fmt, num)
+        st = self.structs.get(key)
+        if st is None:
+            st = struct.Struct('{}{}{}'.format(self.endian, num, fmt))
+            if num <= self.max_cached:
+                self.structs[key] = st
+        return st
+
+    def unpack(self, fmt, data):
+        """Unpack a byte string to the given format, see ``unpack``."""
+        if fmt == 's':
+            # read data as an array of chars
+            return bytes(data)
+        # read a number of values
+        val = self.get_struct(fmt, len(data) // self.sizes[fmt]).unpack(data)
+        if len(val) == 1:
+            val = val[0]
+        return val
+
+
+# codecs for native, little and big endian byte order
+endian_codecs = dict((endian, Codec(endian)) for endian in ('', '<', '>'))
+
+
 def unpack(endian, fmt, data):
     """Unpack a byte string to the given format. If the byte string
     contains more bytes than required for the given format, the function
     returns a tuple of values.
     """
-    if fmt == 's':
-        # read data as an array of chars
-        val = struct.unpack(''.join([endian, str(len(data)), 's']),
-                            data)[0]
-    else:
-        # read a number of values
-        num = len(data) // struct.calcsize(fmt)
-        val = struct.unpack(''.join([endian, str(num), fmt]), data)
-        if len(val) == 1:
-            val = val[0]
-    return val
+    return endian_codecs[endian].unpack(fmt, data)
 
 
 def read_file_header(fd, endian):
@@ -153,12 +237,12 @@ def read_element_tag(fd, endian):
     is also returned.
     """
     data = fd.read(8)
-    mtpn = unpack(endian, 'I', data[:4])
+    mtpn, num_bytes = endian_codecs[endian].tag.unpack(data)
     # The most significant two bytes of mtpn will always be 0,
     # if they are not, this must be SDE format
-    num_bytes = mtpn >> 16
-    if num_bytes > 0:
+    if mtpn >> 16:
         # small data element format
+        num_bytes = mtpn >> 16
         mtpn = mtpn & 0xFFFF
         if num_bytes > 4:
             raise ParseError('Error parsing Small Data Element (SDE) '
@@ -166,36 +250,54 @@ def read_element_tag(fd, endian):
         data = data[4:4 + num_bytes]
     else:
         # regular element
-        num_bytes = unpack(endian, 'I', data[4:])
         data = None
     return (mtpn, num_bytes, data)
 
 
-def read_elements(fd, endian, mtps, is_name=False):
-    """Read elements from the file.
+def check_type(mtpn, mtps):
+    """Verify that data type number mtpn is one of the data types mtps."""
+    if inv_etypes.get(mtpn) not in mtps:
+        raise ParseError('Got type {}, expected {}'.format(
+            mtpn, ' / '.join('{} ({})'.format(
+                etypes[mtp]['n'], mtp) for mtp in mtps)))
+
+
+def read_raw_elements(fd, endian, mtps):
+    """Read elements from the file, without parsing the data.
+    Returns the data type number and the data bytes.
 
     If list of possible matrix data types mtps is provided, the data type
     of the elements are verified.
     """
     mtpn, num_bytes, data = read_element_tag(fd, endian)
-    if mtps and mtpn not in [etypes[mtp]['n'] for mtp in mtps]:
-        raise ParseError('Got type {}, expected {}'.format(
-            mtpn, ' / '.join('{} ({})'.format(
-                etypes[mtp]['n'], mtp) for mtp in mtps)))
+    if mtps:
+        check_type(mtpn, mtps)
     if not data:
         # full format, read data
-        data = fd.read(num_bytes)
-        # Seek to next 64-bit boundary
         mod8 = num_bytes % 8
-        if mod8:
-            fd.seek(8 - mod8, 1)
+        if mod8 and num_bytes < CHUNK_SIZE:
+            # read data and padding up to next 64-bit boundary at once
+            data = fd.read(num_bytes + 8 - mod8)[:num_bytes]
+        else:
+            data = fd.read(num_bytes)
+            # Seek to next 64-bit boundary
+            if mod8:
+                fd.seek(8 - mod8, 1)
+    return mtpn, data
+
+
+def read_elements(fd, endian, mtps, is_name=False):
+    """Read elements from the file.
+
+    If list of possible matrix data types mtps is provided, the data type
+    of the elements are verified.
+    """
+    mtpn, data = read_raw_elements(fd, endian, mtps)
 
     # parse data and return values
     if is_name:
         # names are stored as miINT8 bytes
-        fmt = 's'
-        val = [unpack(endian, fmt, s)
-               for s in data.split(b'\0') if s]
+        val = [s for s in bytes(data).split(b'\0') if s]
         if len(val) == 0:
             val = ''
         elif len(val) == 1:
@@ -210,7 +312,13 @@ def read_elements(fd, endian, mtps, is_name=False):
 
 def read_header(fd, endian):
     """Read and return the matrix header."""
-    flag_class, nzmax = read_elements(fd, endian, ['miUINT32'])
+    # read the array flags element, tag and data, at once
+    mtpn, num_bytes, flag_class, nzmax = \
+        endian_codecs[endian].flags.unpack(fd.read(16))
+    check_type(mtpn, ['miUINT32'])
+    if num_bytes != 8:
+        raise ParseError('Unexpected array flags length: {}'.format(
+                         num_bytes))
     header = {
         'mclass': flag_class & 0x0FF,
         'is_logical': (flag_class >> 9 & 1) == 1,
@@ -220,95 +328,412 @@ def read_header(fd, endian):
     }
     header['dims'] = read_elements(fd, endian, ['miINT32'])
     header['n_dims'] = len(header['dims'])
-    if header['n_dims'] != 2:
-        raise ParseError('Only matrices with dimension 2 are supported.')
     header['name'] = read_elements(fd, endian, ['miINT8'], is_name=True)
     return header
 
 
+def read_endian(fd):
+    """Verify the MAT-file format of file fd, and return the endian
+    format character for reading the file.
+    """
+    # Check mat file format is version 5
+    # For 5 format we need to read an integer in the header.
+    # Bytes 124 through 128 contain a version integer and an
+    # endian test string
+    fd.seek(124)
+    tst_str = fd.read(4)
+    little_endian = (tst_str[2:4] == b'IM')
+    endian = ''
+    if (sys.byteorder == 'little' and little_endian) or \
+       (sys.byteorder == 'big' and not little_endian):
+        # no byte swapping same endian
+        pass
+    elif sys.byteorder == 'little':
+        # byte swapping
+        endian = '>'
+    else:
+        # byte swapping
+        endian = '<'
+    maj_ind = int(little_endian)
+    # major version number
+    maj_val = ord(tst_str[maj_ind]) if ispy2 else tst_str[maj_ind]
+    if maj_val != 1:
+        raise ParseError('Can only read from Matlab level 5 MAT-files')
+    # the minor version number (unused value)
+    # min_val = ord(tst_str[1 - maj_ind]) if ispy2 else tst_str[1 - maj_ind]
+    return endian
+
+
 def read_var_header(fd, endian):
     """Read full header tag.
 
     Return a dict with the parsed header, the file position of next tag,
     a file like object for reading the uncompressed element data.
-    """
-    mtpn, num_bytes = unpack(endian, 'II', fd.read(8))
-    next_pos = fd.tell() + num_bytes
 
-    if mtpn == etypes['miCOMPRESSED']['n']:
-        # read compressed data
-        data = fd.read(num_bytes)
-        dcor = zlib.decompressobj()
+    The header dict is extended with the file offset and byte sizes of the
+    element. Compressed data is inflated incrementally while the element
+    data is read, so only the header is decompressed by this function.
+    """
+    codec = endian_codecs[endian]
+    offset = fd.tell()
+    mtpn, num_bytes = codec.tag.unpack(fd.read(8))
+    next_pos = offset + 8 + num_bytes
+    matrix_bytes = num_bytes
+
+    is_compressed = mtpn == etypes['miCOMPRESSED']['n']
+    if is_compressed:
         # from here, read of the decompressed data
-        fd_var = BytesIO(dcor.decompress(data))
-        del data
-        fd = fd_var
-        # Check the stream is not so broken as to leave cruft behind
-        if dcor.flush() != b'':
-            raise ParseError('Error in compressed data.')
+        fd = InflateReader(fd, num_bytes)
         # read full tag from the uncompressed data
-        mtpn, num_bytes = unpack(endian, 'II', fd.read(8))
+        mtpn, matrix_bytes = codec.tag.unpack(fd.read(8))
 
     if mtpn != etypes['miMATRIX']['n']:
         raise ParseError('Expecting miMATRIX type number {}, '
                          'got {}'.format(etypes['miMATRIX']['n'], mtpn))
     # read the header
     header = read_header(fd, endian)
+    header.update({
+        'offset': offset,
+        'is_compressed': is_compressed,
+        'num_bytes': num_bytes,
+        'matrix_bytes': matrix_bytes
+    })
     return header, next_pos, fd
 
 
-def squeeze(array):
-    """Return array contents if array contains only one element.
-    Otherwise, return the full array.
+def read_numeric_array(fd, endian, header, data_etypes,
+                       options=default_options):
+    """Read a numeric matrix.
+    Returns an array with rows of the numeric matrix, or a NumericArray
+    resp. a NumPy array if the 'array' resp. 'numpy' backend is selected
+    in options. Complex arrays have complex values (as lists or NumPy
+    arrays), or the imaginary part in a separate ``array.array`` (as
+    NumericArray).
     """
-    if len(array) == 1:
-        array = array[0]
-    return array
+    # read array data (stored as column-major)
+    mtpn, data = read_raw_elements(fd, endian, data_etypes)
+    if header['is_complex']:
+        # the imaginary part is stored in a second element, following the
+        # real part
+        imag_mtpn, imag_data = read_raw_elements(fd, endian, data_etypes)
+        return make_complex_array(mtpn, data, imag_mtpn, imag_data,
+                                  endian, header, options)
+    return make_numeric_array(mtpn, data, endian, header, options)
 
 
-def read_numeric_array(fd, endian, header, data_etypes):
-    """Read a numeric matrix.
-    Returns an array with rows of the numeric matrix.
+def make_numeric_array(mtpn, data, endian, header, options=default_options):
+    """Make a numeric matrix of the element data, of data type number mtpn,
+    in the representation selected by the backend option.
     """
-    if header['is_complex']:
-        raise ParseError('Complex arrays are not supported')
-    # read array data (stored as column-major)
-    data = read_elements(fd, endian, data_etypes)
+    if options['backend'] == 'array':
+        return make_typed_array(mtpn, data, endian, header)
+    if options['backend'] == 'numpy':
+        return make_ndarray(mtpn, data, endian, header)
+    data = unpack(endian, etypes[inv_etypes[mtpn]]['fmt'], data)
     if not isinstance(data, Sequence):
         # not an array, just a value
         return data
-    # transform column major data continous array to
-    # a row major array of nested lists
-    rowcount = header['dims'][0]
-    colcount = header['dims'][1]
-    array = [list(data[c * rowcount + r] for c in range(colcount))
-             for r in range(rowcount)]
+    # transform column major data continous array to a row major array
+    # of nested lists, using strided slices (or keep the column major
+    # order, as a list of columns, with order='F')
+    array = nested_lists(data, header['dims'], options['order'])
     # pack and return the array
     return squeeze(array)
 
 
-def read_cell_array(fd, endian, header):
+def make_complex_array(mtpn, data, imag_mtpn, imag_data, endian, header,
+                       options=default_options):
+    """Make a complex numeric matrix of the real and imaginary element
+    data, in the representation selected by the backend option.
+    """
+    if options['backend'] == 'array':
+        real = make_array(mtpn, data, endian)
+        imag = make_array(imag_mtpn, imag_data, endian)
+        if len(real) == 1:
+            return complex(real[0], imag[0])
+        if real.typecode != imag.typecode:
+            # the parts are stored with different data types, convert both
+            # to the data type of the matrix class
+            mc = inv_mclasses[header['mclass']]
+            typecode = etypes[numeric_class_etypes[mc]]['fmt']
+            real = array.array(typecode, real)
+            imag = array.array(typecode, imag)
+        return NumericArray(real, header['dims'], imag,
+                            inv_mclasses[header['mclass']])
+    if options['backend'] == 'numpy':
+        real = ndarray_values(mtpn, data, endian, header)
+        # single precision values make a complex64 array, others complex128
+        values = real.astype(numpy.result_type(real.dtype, numpy.complex64))
+        values.imag = ndarray_values(imag_mtpn, imag_data, endian, header)
+        if values.size == 1:
+            return values[0]
+        return values.reshape(header['dims'], order='F')
+    real = unpack(endian, etypes[inv_etypes[mtpn]]['fmt'], data)
+    imag = unpack(endian, etypes[inv_etypes[imag_mtpn]]['fmt'], imag_data)
+    if not isinstance(real, Sequence):
+        # not an array, just a value
+        return complex(real, imag)
+    data = [complex(r, i) for r, i in izip(real, imag)]
+    return squeeze(nested_lists(data, header['dims'], options['order']))
+
+
+def make_typed_array(mtpn, data, endian, header):
+    """Make a NumericArray of the element data, with the values in an
+    ``array.array`` of the stored data type.
+    Returns the value only, if the matrix contains a single element.
+    """
+    values = make_array(mtpn, data, endian)
+    if len(values) == 1:
+        return values[0]
+    return NumericArray(values, header['dims'],
+                        mclass=inv_mclasses[header['mclass']],
+                        is_logical=header['is_logical'])
+
+
+def extend_array(values, data):
+    """Append the values in the byte string data to the array values."""
+    if ispy2:
+        # array.frombytes is not available in Python 2
+        values.fromstring(bytes(data))
+    else:
+        values.frombytes(data)
+
+
+def make_array(mtpn, data, endian):
+    """Make an ``array.array`` of the element data, of data type number
+    mtpn, in native byte order.
+    """
+    values = array.array(etypes[inv_etypes[mtpn]]['fmt'])
+    extend_array(values, data)
+    if endian:
+        # the file has non-native byte order
+        values.byteswap()
+    return values
+
+
+def make_ndarray(mtpn, data, endian, header):
+    """Make a NumPy array of the element data, of the matrix class data
+    type, with the shape of the matrix.
+    Returns the value only, if the matrix contains a single element.
+
+    The array is a view of the element data (Fortran ordered), unless the
+    data is stored with another data type than the matrix class, in which
+    case the data is converted. Data read from a file is copied, if needed,
+    so that the array is writable, while views of a buffer given to
+    ``loads`` are read-only if the buffer is.
+    """
+    values = ndarray_values(mtpn, data, endian, header)
+    if values.size == 1:
+        return values[0]
+    return values.reshape(header['dims'], order='F')
+
+
+def ndarray_values(mtpn, data, endian, header):
+    """Make a flat NumPy array of the element data, of the matrix class
+    data type."""
+    values = numpy.frombuffer(
+        data, dtype=numpy.dtype(endian + etypes[inv_etypes[mtpn]]['fmt']))
+    mc = inv_mclasses[header['mclass']]
+    dtype = numpy.dtype(etypes[numeric_class_etypes[mc]]['fmt'])
+    if values.dtype != dtype:
+        values = values.astype(dtype)
+    elif isinstance(data, bytes) and not values.flags.writeable:
+        # immutable data read from file (buffers given to loads are
+        # passed as memoryviews, and kept as views)
+        values = values.copy()
+    return values
+
+
+def read_sparse_array(fd, endian, header):
+    """Read a sparse matrix.
+    Returns a SparseMatrix, with the row indices (ir), column pointers (jc)
+    and values (pr) read into arrays, without creating a dense matrix.
+    """
+    if header['is_complex']:
+        raise ParseError('Complex sparse matrices are not supported')
+    index_etypes = ['miINT32', 'miUINT32']
+    mtpn, data = read_raw_elements(fd, endian, index_etypes)
+    indices = make_array(mtpn, data, endian)
+    mtpn, data = read_raw_elements(fd, endian, index_etypes)
+    indptr = make_array(mtpn, data, endian)
+    if len(indptr) != header['dims'][1] + 1:
+        raise ParseError('Unexpected number of sparse column pointers: '
+                         '{}'.format(len(indptr)))
+    mtpn, data = read_raw_elements(fd, endian,
+                                   set(numeric_class_etypes.values()))
+    data = make_array(mtpn, data, endian)
+    # index arrays are allocated for nzmax values, which may be more than
+    # the number of values stored
+    nnz = indptr[-1]
+    if len(indices) > nnz:
+        del indices[nnz:]
+    if len(data) > nnz:
+        del data[nnz:]
+    return SparseMatrix(header['dims'], indices, indptr, data)
+
+
+def slice_range(index, count):
+    """Return the range of indices selected by index (a slice, an int,
+    or None for all indices) from a dimension of length count.
+    """
+    if index is None:
+        index = slice(None)
+    elif not isinstance(index, slice):
+        i = index + count if index < 0 else index
+        if not 0 <= i < count:
+            raise IndexError('Index {} out of range'.format(index))
+        index = slice(i, i + 1)
+    return range(*index.indices(count))
+
+
+def read_element_slice(fd, endian, mc, rowcount, row_ids, col_ids):
+    """Read the selected rows (row_ids) and columns (col_ids) of a numeric
+    data element of a matrix of class mc with rowcount rows.
+
+    Returns a tuple with the data type number, the selected data in
+    column-major order, and the file position at the end of the element
+    (or None for a small data element, which has been read already).
+    """
+    mtpn, num_bytes, data = read_element_tag(fd, endian)
+    check_type(mtpn,
+               set(compressed_numeric).union([numeric_class_etypes[mc]]))
+    size = endian_codecs[endian].sizes[etypes[inv_etypes[mtpn]]['fmt']]
+    start = fd.tell()
+
+    columns = []
+    if row_ids and col_ids:
+        first_row = min(row_ids)
+        num_rows = max(row_ids) + 1 - first_row
+        # read columns in file order
+        for col in (col_ids if col_ids.step > 0 else reversed(col_ids)):
+            pos = (col * rowcount + first_row) * size
+            if data is None:
+                fd.seek(start + pos)
+                column = fd.read(num_rows * size)
+            else:
+                # small data element
+                column = data[pos:pos + num_rows * size]
+            if len(row_ids) < num_rows or row_ids.step < 0:
+                # pick the selected rows of the column
+                column = b''.join(column[(r - first_row) * size:
+                                         (r - first_row + 1) * size]
+                                  for r in row_ids)
+            columns.append(column)
+        if col_ids.step < 0:
+            columns.reverse()
+    # element data is padded to a multiple of 8 bytes
+    end = None if data is not None else start + num_bytes + -num_bytes % 8
+    return mtpn, b''.join(columns), end
+
+
+def read_numeric_slice(fd, endian, header, rows=None, cols=None,
+                       options=default_options):
+    """Read a slice of the rows and columns of a numeric matrix.
+
+    The rows and cols arguments are slices (or an int, or None for all).
+    As the data is stored in column-major order, the selected rows of each
+    column are read as one contiguous range of bytes, seeking past the
+    data in between. For a compressed matrix, the data up to the last
+    selected column is inflated (or up to the last selected column of the
+    imaginary part, for a complex matrix).
+
+    Returns the selected part of the matrix, as for ``read_numeric_array``.
+    """
+    mc = inv_mclasses[header['mclass']]
+    if mc not in numeric_class_etypes or header['n_dims'] != 2:
+        raise ValueError('Slices are only supported for numeric matrices '
+                         'with dimension 2.')
+    rowcount = header['dims'][0]
+    row_ids = slice_range(rows, header['dims'][0])
+    col_ids = slice_range(cols, header['dims'][1])
+
+    mtpn, data, end = read_element_slice(fd, endian, mc, rowcount,
+                                         row_ids, col_ids)
+    header = dict(header, dims=(len(row_ids), len(col_ids)))
+    if not header['is_complex']:
+        return make_numeric_array(mtpn, data, endian, header, options)
+    # the imaginary part follows the real part
+    if end is not None:
+        fd.seek(end)
+    imag_mtpn, imag_data, end = read_element_slice(fd, endian, mc, rowcount,
+                                                   row_ids, col_ids)
+    return make_complex_array(mtpn, data, imag_mtpn, imag_data, endian,
+                              header, options)
+
+
+def read_cell_array(fd, endian, header, options=default_options):
     """Read a cell array.
     Returns an array with rows of the cell array.
+
+    Small cells are read at once, and parsed from memory. Cells with
+    a single row of chars (as in cell arrays of strings) are decoded
+    directly from the element data, see ``read_cell_string``, and interned
+    if the 'intern' option is selected.
     """
+    tag = endian_codecs[endian].tag
     array = [list() for i in range(header['dims'][0])]
     for row in range(header['dims'][0]):
         for col in range(header['dims'][1]):
-            # read the matrix header and array
-            vheader, next_pos, fd_var = read_var_header(fd, endian)
-            varray = read_var_array(fd_var, endian, vheader)
+            mtpn, num_bytes = tag.unpack(fd.read(8))
+            check_type(mtpn, ['miMATRIX'])
+            if num_bytes > CHUNK_SIZE:
+                # read the matrix header and array from file
+                next_pos = fd.tell() + num_bytes
+                vheader = read_header(fd, endian)
+                varray = read_var_array(fd, endian, vheader, options)
+                # move on to next field
+                fd.seek(next_pos)
+                array[row].append(varray)
+                continue
+            element = fd.read(num_bytes)
+            varray = read_cell_string(element, endian)
+            if varray is None:
+                fd_var = BytesIO(element)
+                vheader = read_header(fd_var, endian)
+                varray = read_var_array(fd_var, endian, vheader, options)
+            elif options['intern']:
+                varray = intern(varray)
             array[row].append(varray)
-            # move on to next field
-            fd.seek(next_pos)
     # pack and return the array
     if header['dims'][0] == 1:
         return squeeze(array[0])
     return squeeze(array)
 
 
-def read_struct_array(fd, endian, header):
+def read_cell_string(element, endian):
+    """Decode a string directly from the data of a miMATRIX element
+    holding a char array with (at most) a single row, an empty name, and
+    the usual layout of the header elements (as for the cells of a cell
+    array of strings).
+    Returns None if the element is of any other kind.
+    """
+    if len(element) < 48:
+        return None
+    (flags_type, flags_bytes, flag_class, nzmax, dims_type, dims_bytes,
+     rows, cols, name_tag, name_bytes, mtpn, num_bytes) = \
+        endian_codecs[endian].matrix.unpack_from(element)
+    # char class without flags, two dimensions, and empty miINT8 name
+    if flags_type != 6 or flags_bytes != 8 or \
+            flag_class & 0xFFFF != mclasses['mxCHAR_CLASS'] or \
+            dims_type != 5 or dims_bytes != 8 or rows > 1 or \
+            name_tag != 1 or name_bytes != 0:
+        return None
+    if mtpn >> 16:
+        # small data element format
+        num_bytes = mtpn >> 16
+        mtpn = mtpn & 0xFFFF
+        data = element[44:44 + num_bytes]
+    else:
+        data = element[48:48 + num_bytes]
+    if inv_etypes.get(mtpn) not in char_etypes or len(data) != num_bytes:
+        return None
+    return decode_chars(mtpn, data, endian)
+
+
+def read_struct_array(fd, endian, header, options=default_options):
     """Read a struct array.
-    Returns a dict with fields of the struct array.
+    Returns a dict with fields of the struct array, or a StructColumns
+    object for struct vectors if the 'columnar' option is selected.
     """
     # read field name length (unused, as strings are null terminated)
     field_name_length = read_elements(fd, endian, ['miINT32'])
@@ -321,6 +746,11 @@ def read_struct_array(fd, endian, header):
     if isinstance(fields, basestring):
         fields = [fields]
 
+    rowcount, colcount = header['dims']
+    if options['columnar'] and min(rowcount, colcount) == 1 and \
+            rowcount * colcount > 1:
+        return read_struct_columns(fd, endian, header, fields, options)
+
     # read rows and columns of each field
     empty = lambda: [list() for i in range(header['dims'][0])]
     array = {}
@@ -329,7 +759,7 @@ def read_struct_array(fd, endian, header):
             for field in fields:
                 # read the matrix header and array
                 vheader, next_pos, fd_var = read_var_header(fd, endian)
-                data = read_var_array(fd_var, endian, vheader)
+                data = read_var_array(fd_var, endian, vheader, options)
                 if field not in array:
                     array[field] = empty()
                 array[field][row].append(data)
@@ -344,34 +774,131 @@ def read_struct_array(fd, endian, header):
     return array
 
 
+def read_struct_columns(fd, endian, header, fields, options=default_options):
+    """Read the elements of a struct vector into one column per field.
+    Returns a StructColumns object.
+
+    Numeric scalar values are appended to a typed column, as long as all
+    the values of the field are of the same class. Otherwise, the column
+    is a list of the values, as read by ``read_var_array``.
+
+    The header bytes of the numeric scalars of a typed column are kept, and
+    compared with the following elements of the field, to skip parsing of
+    the headers when they are equal.
+    """
+    tag = endian_codecs[endian].tag
+    columns = [None] * len(fields)
+    # header bytes and data type of the values in each typed column
+    prefixes = [None] * len(fields)
+    column_etypes = [None] * len(fields)
+    for index in range(header['dims'][0] * header['dims'][1]):
+        for i in range(len(fields)):
+            # read the full element at once, and parse it from memory
+            mtpn, num_bytes = tag.unpack(fd.read(8))
+            check_type(mtpn, ['miMATRIX'])
+            element = fd.read(num_bytes)
+            fd_var = BytesIO(element)
+            column = columns[i]
+            prefix = prefixes[i]
+            if prefix is not None and element[:len(prefix)] == prefix:
+                # same header as the previous values of the column
+                fd_var.seek(len(prefix))
+            else:
+                vheader = read_header(fd_var, endian)
+                mc = inv_mclasses[vheader['mclass']]
+                if index == 0 and mc in numeric_class_etypes and \
+                        vheader['n_dims'] == 2 and \
+                        vheader['dims'][0] == 1 and vheader['dims'][1] == 1 \
+                        and not vheader['is_complex']:
+                    # start a typed column with the first value
+                    column_etypes[i] = numeric_class_etypes[mc]
+                    column = columns[i] = array.array(
+                        etypes[column_etypes[i]]['fmt'])
+                    prefix = prefixes[i] = bytes(element[:fd_var.tell()])
+                else:
+                    value = read_var_array(fd_var, endian, vheader, options)
+                    if column is None:
+                        column = columns[i] = []
+                    elif isinstance(column, array.array):
+                        # values of another type, fall back to a list
+                        column = columns[i] = column.tolist()
+                        prefixes[i] = None
+                    column.append(value)
+                    continue
+            # numeric scalar of the class of the column
+            mtp = column_etypes[i]
+            mtpn, data = read_raw_elements(
+                fd_var, endian, set(compressed_numeric).union([mtp]))
+            if mtpn == etypes[mtp]['n'] and not endian:
+                extend_array(column, data)
+            else:
+                column.append(
+                    unpack(endian, etypes[inv_etypes[mtpn]]['fmt'], data))
+    if options['backend'] == 'numpy':
+        columns = [numpy.frombuffer(c, dtype=numpy.dtype(c.typecode))
+                   if isinstance(c, array.array) else c for c in columns]
+    return StructColumns(header['dims'], dict(zip(fields, columns)))
+
+
+def decode_chars(mtpn, data, endian):
+    """Decode the char element data, of data type number mtpn, to a
+    string, with a single call to ``bytes.decode``.
+
+    UTF-8 data not valid as UTF-8 is decoded as latin-1 (as written by
+    earlier versions of mat4py), as is data of 8 bit integer types. UTF-16
+    and UTF-32 data, and data of 16 bit integer types (as commonly written
+    by Matlab), is decoded in the byte order of the file.
+    """
+    mtp = inv_etypes[mtpn]
+    if mtp == 'miUTF8':
+        try:
+            return bytes(data).decode('utf-8')
+        except UnicodeDecodeError:
+            return asstr(bytes(data))
+    if mtp in ('miUTF16', 'miUINT16', 'miUTF32'):
+        little = endian == '<' or (not endian and sys.byteorder == 'little')
+        encoding = 'utf-32' if mtp == 'miUTF32' else 'utf-16'
+        encoding += '-le' if little else '-be'
+        return bytes(data).decode(encoding, 'surrogatepass')
+    return asstr(bytes(data))
+
+
 def read_char_array(fd, endian, header):
-    array = read_numeric_array(fd, endian, header, ['miUTF8'])
-    if header['dims'][0] > 1:
-        # collapse rows of chars into a list of strings
-        array = [asstr(bytearray(i)) for i in array]
-    else:
-        # collaps row of chars into a single string
-        array = asstr(bytearray(array))
-    return array
+    """Read a char array.
+    Returns a string, or a list of strings for a matrix with several rows.
+    """
+    mtpn, data = read_raw_elements(fd, endian, char_etypes)
+    chars = decode_chars(mtpn, data, endian)
+    rowcount = header['dims'][0]
+    if rowcount > 1:
+        # collapse rows of chars into a list of strings, the chars are
+        # stored in column major order
+        return [chars[r::rowcount] for r in range(rowcount)]
+    return chars
 
 
-def read_var_array(fd, endian, header):
+def read_var_array(fd, endian, header, options=default_options):
     """Read variable array (of any supported type)."""
     mc = inv_mclasses[header['mclass']]
 
+    if header['n_dims'] != 2 and mc not in numeric_class_etypes:
+        raise ParseError('Only numeric arrays may have more than two '
+                         'dimensions.')
+
     if mc in numeric_class_etypes:
         return read_numeric_array(
             fd, endian, header,
-            set(compressed_numeric).union([numeric_class_etypes[mc]])
+            set(compressed_numeric).union([numeric_class_etypes[mc]]),
+            options
         )
     elif mc == 'mxSPARSE_CLASS':
-        raise ParseError('Sparse matrices not supported')
+        return read_sparse_array(fd, endian, header)
     elif mc == 'mxCHAR_CLASS':
         return read_char_array(fd, endian, header)
     elif mc == 'mxCELL_CLASS':
-        return read_cell_array(fd, endian, header)
+        return read_cell_array(fd, endian, header, options)
     elif mc == 'mxSTRUCT_CLASS':
-        return read_struct_array(fd, endian, header)
+        return read_struct_array(fd, endian, header, options)
     elif mc == 'mxOBJECT_CLASS':
         raise ParseError('Object classes not supported')
     elif mc == 'mxFUNCTION_CLASS':
@@ -382,6 +909,8 @@ def read_var_array(fd, endian, header):
 
 def eof(fd):
     """Determine if end-of-file is reached for file fd."""
+    if isinstance(fd, ForwardReader):
+        return fd.eof()
     b = fd.read(1)
     end = len(b) == 0
     if not end:
@@ -394,15 +923,468 @@ class ParseError(Exception):
     pass
 
 
+def make_options(backend='list', order='C', columnar=False, intern=False):
+    """Return a dict with options for reading variable arrays."""
+    if backend not in backends:
+        raise ValueError('Unknown backend {!r}, expected one of {}'.format(
+            backend, ', '.join(backends)))
+    if backend == 'numpy' and numpy is None:
+        raise ImportError('The numpy backend requires NumPy')
+    if order not in ('C', 'F'):
+        raise ValueError("Unknown order {!r}, expected 'C' or 'F'".format(
+            order))
+    return dict(default_options, backend=backend, order=order,
+                columnar=bool(columnar), intern=bool(intern))
+
+
+class InflateReader(object):
+    """File like object for reading the data of a miCOMPRESSED element.
+
+    Compressed data is read from the file fd in chunks of at most
+    CHUNK_SIZE bytes, and inflated on demand, so that only the requested
+    part of the element is decompressed. Small reads are served from a
+    window of at most CHUNK_SIZE inflated bytes, while large reads are
+    inflated directly into the returned buffer. Seeking is supported in the
+    forward direction only, skipped data is inflated and discarded.
+    """
+
+    def __init__(self, fd, num_bytes):
+        self.fd = fd
+        # number of compressed bytes not yet read from fd
+        self.remaining = num_bytes
+        # read small chunks first, as often only the header is needed
+        self.chunk_size = 512
+        self.dcor = zlib.decompressobj()
+        # window of inflated data, and read offset in the window
+        self.buffer = b''
+        self.offset = 0
+        self.pos = 0
+
+    def _inflate(self, size):
+        """Inflate at most size bytes of data.
+        Returns an empty byte string at the end of the compressed data.
+        """
+        while True:
+            data = self.dcor.unconsumed_tail
+            if not data:
+                if self.dcor.unused_data:
+                    # end of the compressed stream (decompressobj has no
+                    # eof attribute in Python 2)
+                    return b''
+                if self.remaining == 0:
+                    # output may be pending due to the size limit
+                    return self.dcor.decompress(b'', size)
+                data = self.fd.read(min(self.chunk_size, self.remaining))
+                if not data:
+                    raise ParseError('Unexpected end of compressed data.')
+                self.remaining -= len(data)
+                self.chunk_size = min(2 * self.chunk_size, CHUNK_SIZE)
+            data = self.dcor.decompress(data, size)
+            if data:
+                return data
+
+    def _fill(self, size):
+        """Refill the window with at least size bytes (if available)."""
+        chunks = [self.buffer[self.offset:]]
+        count = len(chunks[0])
+        while count < size:
+            data = self._inflate(CHUNK_SIZE - count)
+            if not data:
+                break
+            chunks.append(data)
+            count += len(data)
+        self.buffer = b''.join(chunks)
+        self.offset = 0
+
+    def _read_large(self, size):
+        """Read size bytes into a preallocated buffer, to avoid holding
+        both the inflated chunks and a joined copy of them in memory.
+        """
+        buf = bytearray(size)
+        count = len(self.buffer) - self.offset
+        buf[:count] = memoryview(self.buffer)[self.offset:]
+        self.buffer = b''
+        self.offset = 0
+        while count < size:
+            data = self._inflate(size - count)
+            if not data:
+                del buf[count:]
+                break
+            buf[count:count + len(data)] = data
+            count += len(data)
+        self.pos += count
+        return buf
+
+    def read(self, size):
+        """Read size bytes of decompressed data."""
+        if size <= 0:
+            return b''
+        if self.offset + size > len(self.buffer):
+            if size >= CHUNK_SIZE:
+                return self._read_large(size)
+            self._fill(size)
+        data = self.buffer[self.offset:self.offset + size]
+        self.offset += len(data)
+        self.pos += len(data)
+        return data
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence != 0:
+            raise ValueError('Unsupported whence value {}'.format(whence))
+        if offset < self.pos:
+            raise ParseError('Cannot seek backwards in compressed data.')
+        available = len(self.buffer) - self.offset
+        if offset - self.pos <= available:
+            self.offset += offset - self.pos
+            self.pos = offset
+            return self.pos
+        # discard the window, and inflate up to the new position
+        self.pos += available
+        self.buffer = b''
+        self.offset = 0
+        while self.pos < offset:
+            data = self._inflate(min(offset - self.pos, CHUNK_SIZE))
+            if not data:
+                raise ParseError('Unexpected end of compressed data.')
+            self.pos += len(data)
+        return self.pos
+
+
 #
 # Read from MAT file
 #
 
 
-def loadmat(filename, meta=False):
+def scan_variables(fd, endian, variable_names=None):
+    """Generate the header and a file like object for reading the data of
+    each variable in file fd, starting at the current file position.
+
+    If a set of variable_names is given, only those variables are
+    generated, and names found are removed from the set. The generator
+    stops when the set is empty.
+    """
+    while not eof(fd) and variable_names != set():
+        hdr, next_position, fd_var = read_var_header(fd, endian)
+        if variable_names is not None:
+            if hdr['name'] not in variable_names:
+                # skip the variable, without reading the array data
+                fd.seek(next_position)
+                continue
+            variable_names.discard(hdr['name'])
+        yield hdr, fd_var
+        # move on to next entry in file
+        fd.seek(next_position)
+
+
+class ForwardReader(object):
+    """File like object for reading a non-seekable stream, e.g. a pipe,
+    a socket or a decompressing stream, from its start.
+
+    Reads are repeated until the requested number of bytes is read, or the
+    end of the stream is reached. The position in the stream is tracked,
+    and seeking is supported in the forward direction only, skipped data
+    is read and discarded. The end of the stream is detected by reading
+    ahead one byte.
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+        # data read ahead, at the current position
+        self.pending = b''
+        self.pos = 0
+
+    def read(self, size):
+        """Read size bytes (fewer only at the end of the stream)."""
+        if size <= 0:
+            return b''
+        chunks = [self.pending[:size]]
+        self.pending = self.pending[size:]
+        count = len(chunks[0])
+        while count < size:
+            data = self.fd.read(size - count)
+            if not data:
+                break
+            chunks.append(data)
+            count += len(data)
+        self.pos += count
+        return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+
+    def eof(self):
+        """Return True if the end of the stream is reached."""
+        if not self.pending:
+            self.pending = self.fd.read(1)
+        return not self.pending
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence != 0:
+            raise ValueError('Unsupported whence value {}'.format(whence))
+        if offset < self.pos:
+            raise ParseError('Cannot seek backwards in a non-seekable '
+                             'stream.')
+        while self.pos < offset:
+            if not self.read(min(offset - self.pos, CHUNK_SIZE)):
+                break
+        return self.pos
+
+    def seekable(self):
+        return False
+
+
+class BufferReader(object):
+    """File like object for reading from a buffer in memory, e.g. bytes,
+    a bytearray, a memoryview or an mmap.
+
+    Reads return memoryview slices of the buffer, so the data is not
+    copied (until it is decoded).
+    """
+
+    def __init__(self, buffer):
+        self.buffer = memoryview(buffer).cast('B')
+        self.pos = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self.buffer) - self.pos
+        data = self.buffer[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += len(self.buffer)
+        elif whence != 0:
+            raise ValueError('Unsupported whence value {}'.format(whence))
+        self.pos = max(offset, 0)
+        return self.pos
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        pass
+
+
+def forward_reader(fd):
+    """Return fd, or a ForwardReader of fd if it is not seekable."""
+    try:
+        if fd.seekable():
+            return fd
+    except AttributeError:
+        # file objects without a seekable method are assumed seekable if
+        # they have a seek method (while the seekable method of some
+        # streams, e.g. of tar file members, fails)
+        if not hasattr(fd, 'seekable') and hasattr(fd, 'seek'):
+            return fd
+    return ForwardReader(fd)
+
+
+def indexed_variables(fd, endian, index, variable_names=None):
+    """Generate the header and a file like object for reading the data of
+    each variable in file fd, like ``scan_variables``, seeking directly to
+    the variables listed in the index (see ``read_index``).
+    """
+    for entry in index['variables']:
+        if variable_names is not None:
+            if not variable_names:
+                break
+            if entry['name'] not in variable_names:
+                continue
+            variable_names.discard(entry['name'])
+        fd.seek(entry['offset'])
+        hdr, next_position, fd_var = read_var_header(fd, endian)
+        yield hdr, fd_var
+
+
+def inflate_variables(fd, endian, variable_names, workers):
+    """Generate the header and a file like object for reading the data of
+    each variable in file fd, like ``scan_variables``.
+
+    The variable headers are scanned first, and then the compressed
+    variables are read and inflated ahead, in a pool of worker threads.
+    """
+    if ThreadPoolExecutor is None:
+        raise RuntimeError('Parallel loading requires concurrent.futures')
+    headers = iter([hdr for hdr, fd_var in
+                    scan_variables(fd, endian, variable_names)])
+
+    def submit(hdr):
+        if not hdr['is_compressed']:
+            # uncompressed data is read directly from file
+            return hdr, None
+        fd.seek(hdr['offset'] + 8)
+        return hdr, executor.submit(zlib.decompress,
+                                    fd.read(hdr['num_bytes']))
+
+    with ThreadPoolExecutor(workers) as executor:
+        # limit the number of variables held in memory, when inflated ahead
+        queue = deque(submit(hdr) for hdr in islice(headers, 2 * workers))
+        while queue:
+            hdr, future = queue.popleft()
+            if future is None:
+                fd.seek(hdr['offset'])
+                hdr, next_position, fd_var = read_var_header(fd, endian)
+            else:
+                fd_var = BytesIO(future.result())
+                del future
+                # skip the tag and header of the inflated data
+                read_var_header(fd_var, endian)
+            yield hdr, fd_var
+            del fd_var
+            for hdr in islice(headers, 1):
+                queue.append(submit(hdr))
+
+
+def make_cache_key(filename, options=default_options):
+    """Return the key prefix for caching the variables of a file (given by
+    name or as a file object) read with options: the file identity and the
+    options. The variable name is appended to the prefix, for the key of
+    a variable.
+    Returns None if the file is not on disk.
+    """
+    path = getattr(filename, 'name', filename)
+    if isinstance(path, basestring) and os.path.isfile(path):
+        return (file_identity(path), tuple(sorted(options.items())))
+    return None
+
+
+def read_cached_var_array(cache, key, fd, endian, header,
+                          options=default_options):
+    """Return the value of key in cache, or read the variable array and
+    store it in cache."""
+    value = cache.get(key)
+    if value is None:
+        value = read_var_array(fd, endian, header, options)
+        cache.set(key, value)
+    return value
+
+
+def iter_variables(filename, variable_names=None, backend='list', order='C',
+                   meta=None, workers=None, slices=None, columnar=False,
+                   intern=False, cache=None):
+    """Iterate over the variables in MAT-file:
+
+    for name, value in iter_variables(filename, variable_names=None,
+                                      backend='list', order='C', meta=None,
+                                      workers=None, slices=None,
+                                      columnar=False, intern=False,
+                                      cache=None):
+        ...
+
+    The filename argument is either a string with the filename, or
+    a file like object. A file object that is not seekable (e.g. a pipe or
+    a socket) is read forward only, see ``ForwardReader``.
+
+    The function returns a generator, yielding a tuple with the name and
+    value of each variable, in file order. A variable is read from file
+    when the generator is advanced to it, so only one variable at a time
+    needs to be held in memory.
+
+    The parameters variable_names, backend, order, workers, slices,
+    columnar, intern and cache are described in ``loadmat``.
+
+    Give a dict as the meta parameter to have meta data stored in the dict,
+    as ``loadmat`` does with meta=True: the file header (key
+    ``'__header__'``) is stored before the first variable is yielded, and
+    the names of global variables (key ``'__globals__'``) are appended
+    as they are read.
+
+    A ``ParseError`` exception is raised if the MAT-file is corrupt or
+    contains a data type that cannot be parsed.
+    """
+
+    options = make_options(backend, order, columnar, intern)
+
+    if isinstance(variable_names, basestring):
+        variable_names = [variable_names]
+    if variable_names is not None:
+        # names of the requested variables not yet found
+        variable_names = set(variable_names)
+
+    if cache is not None:
+        cache_key = make_cache_key(filename, options)
+        if cache_key is None:
+            cache = None
+
+    if isinstance(filename, basestring):
+        fd = open(filename, 'rb')
+    else:
+        fd = forward_reader(filename)
+
+    try:
+        # read the file header once, so that non-seekable streams are
+        # read forward only
+        fd.seek(0)
+        head = BytesIO(fd.read(128))
+        endian = read_endian(head)
+
+        if meta is not None:
+            head.seek(0)
+            meta['__header__'] = read_file_header(head, endian)
+            meta['__globals__'] = []
+
+        # read data elements (the variables of a stream are read in order,
+        # as headers cannot be scanned ahead)
+        parallel = workers is not None and workers > 1 and \
+            not isinstance(fd, ForwardReader)
+        # use the sidecar index file, if there is an up to date one
+        index = None if parallel else read_index(filename)
+        if index is not None:
+            variables = indexed_variables(fd, endian, index, variable_names)
+        elif parallel:
+            variables = inflate_variables(fd, endian, variable_names, workers)
+        else:
+            variables = scan_variables(fd, endian, variable_names)
+        names = set()
+        for hdr, fd_var in variables:
+            name = hdr['name']
+            if name in names:
+                raise ParseError('Duplicate variable name "{}" in mat file.'
+                                 .format(name))
+            names.add(name)
+
+            # read the matrix
+            if slices and name in slices:
+                rows, cols = slices[name]
+                value = read_numeric_slice(fd_var, endian, hdr, rows, cols,
+                                           options)
+            elif cache is not None:
+                value = read_cached_var_array(
+                    cache, cache_key + (name,), fd_var, endian, hdr, options)
+            else:
+                value = read_var_array(fd_var, endian, hdr, options)
+            del fd_var
+            if meta is not None and hdr['is_global']:
+                meta['__globals__'].append(name)
+            yield name, value
+            del value
+    finally:
+        if isinstance(filename, basestring):
+            fd.close()
+
+
+def loadmat(filename, meta=False, variable_names=None, backend='list',
+            order='C', workers=None, slices=None, columnar=False,
+            intern=False, cache=None):
     """Load data from MAT-file:
 
-    data = loadmat(filename, meta=False)
+    data = loadmat(filename, meta=False, variable_names=None, backend='list',
+                   order='C', workers=None, slices=None, columnar=False,
+                   intern=False, cache=None)
 
     The filename argument is either a string with the filename, or
     a file like object.
@@ -413,6 +1395,64 @@ def loadmat(filename, meta=False):
     Call ``loadmat`` with parameter meta=True to include meta data, such
     as file header information and list of globals.
 
+    Use parameter variable_names to give a list of names of the variables
+    to load. Other variables in the file are skipped, without reading (or
+    decompressing) their array data. Reading of the file stops when all
+    requested variables have been found.
+
+    The parameter backend selects the representation of numeric arrays:
+
+    * ``'list'``: row-major nested lists (the default)
+    * ``'array'``: ``NumericArray`` objects, holding the values in a compact
+      column-major ``array.array`` of the stored data type, and the array
+      dimensions
+    * ``'numpy'``: NumPy arrays of the Matlab class data type, created as
+      views of the element data where possible (requires NumPy)
+
+    Numeric arrays with a single element are returned as a value.
+
+    With the 'list' backend, numeric arrays are returned as a list of rows
+    when order='C'. Use order='F' to skip the transposition of the column
+    major data, and get a list of columns instead. Numeric arrays with more
+    than two dimensions are returned as nested lists with one level per
+    dimension (with the 'list' backend), or with their full shape.
+
+    Give a number of workers larger than one, to have compressed variables
+    inflated in parallel in a pool of worker threads. The variable headers
+    are then scanned first, and up to twice the number of workers variables
+    are read and inflated ahead, while the arrays are decoded (in order).
+    Inflated variables are held in memory in full, when inflated ahead.
+
+    Use parameter slices to load only part of numeric matrices. It is a
+    dict mapping variable names to a tuple (rows, cols) of slices (or ints,
+    or None for all) selecting the rows and columns to load, e.g.
+    ``slices={'x': (None, slice(0, 4))}`` loads the first four columns of
+    ``x``. The selected rows of each column are read directly from file,
+    and the data of compressed matrices is inflated only up to the last
+    selected column.
+
+    With columnar=True, struct arrays of dimensions 1xN or Nx1 (N > 1) are
+    returned as ``StructColumns`` objects, mapping each field name to a
+    column with the values of all elements. Fields with numeric scalar
+    values are decoded into compact typed columns, instead of one list item
+    (and Python object) per element.
+
+    With intern=True, the strings in cell arrays are interned, so that
+    repeated values (e.g. labels in a cell array of strings) are held in
+    memory only once.
+
+    Give a cache, e.g. a ``mat4py.cache.DiskCache``, to have the loaded
+    variables stored in the cache, and served from the cache when the same
+    file (by path, size, modification time and content hash) is loaded
+    again with the same options. The variable headers are still read from
+    the file, but the array data of cached variables is not decoded.
+    A cache is any object with the methods ``get(key)`` (returning None if
+    key is not cached) and ``set(key, value)``. Only files on disk (given by
+    name, or as a file object with the name of the file) are cached, and
+    slices are never cached. Array objects returned from a
+    ``mat4py.cache.VariableCache`` are shared with the cache, and should not
+    be modified (lists and dicts are copied).
+
     A ``ParseError`` exception is raised if the MAT-file is corrupt or
     contains a data type that cannot be parsed.
     """
@@ -422,54 +1462,201 @@ def loadmat(filename, meta=False):
     else:
         fd = filename
 
-    # Check mat file format is version 5
-    # For 5 format we need to read an integer in the header.
-    # Bytes 124 through 128 contain a version integer and an
-    # endian test string
-    fd.seek(124)
-    tst_str = fd.read(4)
-    little_endian = (tst_str[2:4] == b'IM')
-    endian = ''
-    if (sys.byteorder == 'little' and little_endian) or \
-       (sys.byteorder == 'big' and not little_endian):
-        # no byte swapping same endian
-        pass
-    elif sys.byteorder == 'little':
-        # byte swapping
-        endian = '>'
-    else:
-        # byte swapping
-        endian = '<'
-    maj_ind = int(little_endian)
-    # major version number
-    maj_val = ord(tst_str[maj_ind]) if ispy2 else tst_str[maj_ind]
-    if maj_val != 1:
-        raise ParseError('Can only read from Matlab level 5 MAT-files')
-    # the minor version number (unused value)
-    # min_val = ord(tst_str[1 - maj_ind]) if ispy2 else tst_str[1 - maj_ind]
-
     mdict = {}
-    if meta:
-        # read the file header
-        fd.seek(0)
-        mdict['__header__'] = read_file_header(fd, endian)
-        mdict['__globals__'] = []
+    try:
+        # meta data is stored directly in the returned dict
+        for name, value in iter_variables(fd, variable_names, backend, order,
+                                          mdict if meta else None, workers,
+                                          slices, columnar, intern, cache):
+            mdict[name] = value
+    finally:
+        fd.close()
+    return mdict
 
-    # read data elements
-    while not eof(fd):
-        hdr, next_position, fd_var = read_var_header(fd, endian)
-        name = hdr['name']
-        if name in mdict:
-            raise ParseError('Duplicate variable name "{}" in mat file.'
-                             .format(name))
 
-        # read the matrix
-        mdict[name] = read_var_array(fd_var, endian, hdr)
-        if meta and hdr['is_global']:
-            mdict['__globals__'].append(name)
+def loads(buffer, meta=False, variable_names=None, backend='list',
+          order='C', workers=None, slices=None, columnar=False,
+          intern=False):
+    """Load data from a MAT-file in memory:
 
-        # move on to next entry in file
-        fd.seek(next_position)
+    data = loads(buffer, meta=False, variable_names=None, backend='list',
+                 order='C', workers=None, slices=None, columnar=False,
+                 intern=False)
 
-    fd.close()
+    The buffer argument is an object supporting the buffer protocol, with
+    the contents of a MAT-file, e.g. bytes, a bytearray, a memoryview or an
+    mmap. The data is parsed directly from the buffer, see
+    ``BufferReader``. With backend='numpy', the arrays of uncompressed
+    numeric variables stored with the data type of their class are views of
+    the buffer (read-only for immutable buffers), and keep a reference to
+    the buffer.
+
+    The other parameters, and the returned data, are as for ``loadmat``.
+    """
+    mdict = {}
+    # meta data is stored directly in the returned dict
+    for name, value in iter_variables(BufferReader(buffer), variable_names,
+                                      backend, order, mdict if meta else None,
+                                      workers, slices, columnar, intern):
+        mdict[name] = value
     return mdict
+
+
+def whosmat(filename):
+    """List variables stored in MAT-file:
+
+    variables = whosmat(filename)
+
+    The filename argument is either a string with the filename, or
+    a file like object.
+
+    The returned parameter ``variables`` is a list with a dict for each
+    variable in the MAT-file, in file order. Only the variable headers are
+    read, array data is never decoded (and compressed data is only inflated
+    as far as needed for reading the header). Each dict has the keys:
+
+    * ``name``: the variable name
+    * ``mclass``: the Matlab array class, e.g. ``'mxDOUBLE_CLASS'``
+    * ``dims``: the array dimensions
+    * ``is_global``: True if the variable is global
+    * ``is_compressed``: True if the variable is stored compressed
+    * ``offset``: file offset of the variable data element
+    * ``num_bytes``: number of bytes of the element in the file
+    * ``matrix_bytes``: number of bytes of the uncompressed array data
+
+    A ``ParseError`` exception is raised if the MAT-file is corrupt.
+    """
+
+    if isinstance(filename, basestring):
+        fd = open(filename, 'rb')
+    else:
+        fd = forward_reader(filename)
+
+    try:
+        endian = read_endian(fd)
+        variables = []
+        for hdr, fd_var in scan_variables(fd, endian):
+            variables.append({
+                'name': hdr['name'],
+                'mclass': inv_mclasses.get(hdr['mclass'], hdr['mclass']),
+                'dims': hdr['dims'],
+                'is_global': hdr['is_global'],
+                'is_compressed': hdr['is_compressed'],
+                'offset': hdr['offset'],
+                'num_bytes': hdr['num_bytes'],
+                'matrix_bytes': hdr['matrix_bytes']
+            })
+    finally:
+        if isinstance(filename, basestring):
+            fd.close()
+    return variables
+
+
+def index_path(filename):
+    """Return the path of the sidecar index file of a MAT-file (given by
+    name or as a file object), or None if the file is not on disk."""
+    path = getattr(filename, 'name', filename)
+    if isinstance(path, basestring) and os.path.isfile(path):
+        return path + INDEX_EXT
+    return None
+
+
+def element_offsets(fd, endian, header):
+    """Return the file offsets of the elements (cells, or field values) of
+    the cell or struct array of header, with the data of the array read
+    from the current position of file fd, and the field names of a struct
+    array (or None).
+
+    The field values of a struct array are stored field by field for each
+    element, with the elements in column major order.
+    """
+    fields = None
+    if inv_mclasses[header['mclass']] == 'mxSTRUCT_CLASS':
+        read_elements(fd, endian, ['miINT32'])
+        fields = read_elements(fd, endian, ['miINT8'], is_name=True)
+        if isinstance(fields, basestring):
+            fields = [fields]
+        count = len(fields) * header['dims'][0] * header['dims'][1]
+    else:
+        count = header['dims'][0] * header['dims'][1]
+    tag = endian_codecs[endian].tag
+    offsets = []
+    for i in range(count):
+        offset = fd.tell()
+        mtpn, num_bytes = tag.unpack(fd.read(8))
+        check_type(mtpn, ['miMATRIX'])
+        offsets.append(offset)
+        fd.seek(offset + 8 + num_bytes)
+    return offsets, fields
+
+
+def build_index(fd):
+    """Return the index of the MAT-file fd, with the header of each
+    variable, as a dict that can be serialized to JSON (see
+    ``write_index``)."""
+    endian = read_endian(fd)
+    variables = []
+    for hdr, fd_var in scan_variables(fd, endian):
+        entry = dict(hdr, dims=list(hdr['dims']))
+        mc = inv_mclasses[hdr['mclass']]
+        if mc in ('mxCELL_CLASS', 'mxSTRUCT_CLASS') and \
+                not hdr['is_compressed']:
+            # offsets of the nested elements (not known without inflating
+            # the data of compressed arrays)
+            entry['elements'], fields = element_offsets(fd_var, endian, hdr)
+            if fields is not None:
+                entry['fields'] = fields
+        variables.append(entry)
+    return {'version': INDEX_VERSION, 'variables': variables}
+
+
+def write_index(filename):
+    """Write a sidecar index file for a MAT-file:
+
+    path = write_index(filename)
+
+    The index file is stored next to the MAT-file, with the extension
+    ``.matidx`` appended to the file name, and the path of the index file
+    is returned. It is a JSON file with the header, offset and size of each
+    variable, and the offsets of the cells and field values of uncompressed
+    cell and struct arrays.
+
+    ``loadmat``, ``iter_variables`` and ``MatFile`` use the index file when
+    it is present and up to date, to seek directly to the variables rather
+    than scanning the file. The index is ignored once the size or
+    modification time of the MAT-file changes.
+    """
+    path = index_path(filename)
+    if path is None:
+        raise ValueError('Index files can only be written for files on disk')
+    filename = path[:-len(INDEX_EXT)]
+    stat = os.stat(filename)
+    with open(filename, 'rb') as fd:
+        index = build_index(fd)
+    index.update({'size': stat.st_size, 'mtime': stat.st_mtime})
+    with open(path, 'w') as fp:
+        json.dump(index, fp)
+    return path
+
+
+def read_index(filename):
+    """Read the sidecar index file of a MAT-file (given by name or as a file
+    object), see ``write_index``.
+    Returns None if there is no index file, or if it is out of date.
+    """
+    path = index_path(filename)
+    if path is None or not os.path.isfile(path):
+        return None
+    stat = os.stat(path[:-len(INDEX_EXT)])
+    try:
+        with open(path) as fp:
+            index = json.load(fp)
+    except ValueError:
+        return None
+    if index.get('version') != INDEX_VERSION or \
+            index.get('size') != stat.st_size or \
+            index.get('mtime') != stat.st_mtime:
+        return None
+    for entry in index['variables']:
+        entry['dims'] = tuple(entry['dims'])
+    return index
@@ -0,0 +1,202 @@
+"""lazy access to data in the Matlab (TM) MAT-file format
+
+Copyright (c) 2011-2023 Nephics AB
+The MIT License (MIT)
+"""
+
+__all__ = ['MatFile']
+
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+try:
+    basestring
+except NameError:
+    basestring = str
+
+from .loadmat import (ParseError, element_offsets, inv_mclasses,
+                      make_cache_key, make_options, read_cached_var_array,
+                      read_endian, read_index, read_numeric_slice,
+                      read_var_array, read_var_header, scan_variables)
+
+
+class MatFile(Mapping):
+    """Read-only mapping of the variables in a MAT-file:
+
+    with MatFile(filename, backend='list', order='C', columnar=False,
+                 intern=False, cache=None) as mf:
+        x = mf['x']
+
+    The filename argument is either a string with the filename, or
+    a file like object. The backend, order, columnar and intern arguments
+    select the representation of numeric, struct and cell arrays, as for
+    ``loadmat``.
+
+    The variable headers are read when the file is opened (from the
+    sidecar index file, if there is an up to date one, see ``write_index``),
+    while the array data of a variable is read (and decompressed) when the
+    variable is first accessed. Loaded variables are cached, and returned as
+    is on subsequent access.
+
+    Give a cache shared between MatFile objects, e.g. a
+    ``mat4py.cache.VariableCache``, to have variables loaded from the cache
+    if the same file has been read before (with the same options), as for
+    ``loadmat``. Array objects from a ``VariableCache`` are shared with the
+    cache, and should not be modified.
+
+    The file is kept open until ``close`` is called, or the ``with`` block
+    is exited. A file object given as argument is not closed.
+
+    A ``ParseError`` exception is raised if the MAT-file is corrupt or
+    contains a data type that cannot be parsed.
+    """
+
+    def __init__(self, filename, backend='list', order='C', columnar=False,
+                 intern=False, cache=None):
+        self.options = make_options(backend, order, columnar, intern)
+        self.shared_cache = cache
+        self.cache_key = None
+        if cache is not None:
+            self.cache_key = make_cache_key(filename, self.options)
+        if isinstance(filename, basestring):
+            self.fd = open(filename, 'rb')
+            self.owns_fd = True
+        else:
+            self.fd = filename
+            self.owns_fd = False
+        self.cache = {}
+        try:
+            self.endian = read_endian(self.fd)
+            index = read_index(filename)
+            if index is not None:
+                self.headers = self._index_headers(index)
+            else:
+                self.headers = self._read_headers()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_headers(self):
+        """Return a dict with the header of each variable in the file."""
+        headers = {}
+        names = []
+        for hdr, fd_var in scan_variables(self.fd, self.endian):
+            name = hdr['name']
+            if name in headers:
+                raise ParseError('Duplicate variable name "{}" in mat file.'
+                                 .format(name))
+            headers[name] = hdr
+            names.append(name)
+        self.names = names
+        return headers
+
+    def _index_headers(self, index):
+        """Return a dict with the header of each variable in the index."""
+        headers = dict((entry['name'], entry)
+                       for entry in index['variables'])
+        self.names = [entry['name'] for entry in index['variables']]
+        return headers
+
+    def open_variable(self, name):
+        """Return the header of the variable, and a file like object
+        for reading its array data.
+        """
+        hdr = self.headers[name]
+        if self.fd is None:
+            raise ValueError('I/O operation on closed MatFile.')
+        self.fd.seek(hdr['offset'])
+        hdr, next_position, fd_var = read_var_header(self.fd, self.endian)
+        return hdr, fd_var
+
+    def __getitem__(self, name):
+        if name in self.cache:
+            return self.cache[name]
+        hdr, fd_var = self.open_variable(name)
+        if self.cache_key is not None:
+            value = read_cached_var_array(
+                self.shared_cache, self.cache_key + (name,), fd_var,
+                self.endian, hdr, self.options)
+        else:
+            value = read_var_array(fd_var, self.endian, hdr, self.options)
+        self.cache[name] = value
+        return value
+
+    def read_slice(self, name, rows=None, cols=None):
+        """Read a slice of the rows and columns of a numeric matrix:
+
+        x = mf.read_slice('x', slice(0, 10), slice(2, 4))
+
+        The rows and cols arguments are slices, ints, or None (for all).
+        Only the data of the selected rows and columns is read from file
+        (the data of a compressed matrix is inflated up to the last selected
+        column). The result is not cached.
+        """
+        hdr, fd_var = self.open_variable(name)
+        return read_numeric_slice(fd_var, self.endian, hdr, rows, cols,
+                                  self.options)
+
+    def read_element(self, name, index, field=None):
+        """Read a single cell of a cell array, or the value of a field of
+        a single element of a struct array:
+
+        c = mf.read_element('c', 3)
+        v = mf.read_element('s', 3, 'field')
+
+        The index is the (zero based) index of the element, in column major
+        order. Only the data of the element is read from file, at the offset
+        given in the index file (or found by skipping over the preceding
+        elements). Elements can only be read from uncompressed arrays. The
+        result is not cached.
+        """
+        hdr = self.headers[name]
+        mc = inv_mclasses[hdr['mclass']]
+        if mc not in ('mxCELL_CLASS', 'mxSTRUCT_CLASS') or \
+                hdr['is_compressed']:
+            raise ValueError('Elements can only be read from uncompressed '
+                             'cell and struct arrays')
+        if 'elements' not in hdr:
+            hdr, fd_var = self.open_variable(name)
+            hdr['elements'], fields = element_offsets(
+                fd_var, self.endian, hdr)
+            if fields is not None:
+                hdr['fields'] = fields
+            self.headers[name] = hdr
+        count = hdr['dims'][0] * hdr['dims'][1]
+        if not -count <= index < count:
+            raise IndexError('Element index out of range')
+        index %= count
+        if mc == 'mxSTRUCT_CLASS':
+            fields = hdr['fields']
+            if field not in fields:
+                raise KeyError(field)
+            index = index * len(fields) + fields.index(field)
+        if self.fd is None:
+            raise ValueError('I/O operation on closed MatFile.')
+        self.fd.seek(hdr['elements'][index])
+        vhdr, next_position, fd_var = read_var_header(self.fd, self.endian)
+        return read_var_array(fd_var, self.endian, vhdr, self.options)
+
+    def __contains__(self, name):
+        # check the headers, without loading the variable
+        return name in self.headers
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def close(self):
+        """Close the file. Cached variables remain available."""
+        if self.fd is not None and self.owns_fd:
+            self.fd.close()
+        self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
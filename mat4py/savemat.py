@@ -4,7 +4,7 @@ Copyright (c) 2011-2023 Nephics AB
 The MIT License (MIT)
 """
 
-__all__ = ['savemat']
+__all__ = ['savemat', 'dumps']
 
 
 import struct
@@ -27,6 +27,8 @@ except ImportError:
     ispy2 = False
 from io import BytesIO
 
+from .arrays import NumericArray, SparseMatrix, typed_values
+
 
 # encode a string to bytes and vice versa
 asbytes = lambda s: s.encode('latin1')
@@ -92,6 +94,25 @@ numeric_class_etypes = {
 
 inv_mclasses = dict((v, k) for k, v in mclasses.items())
 
+# inverse mapping of numeric_class_etypes
+etype_numeric_classes = dict(
+    (v, k) for k, v in numeric_class_etypes.items())
+
+# map of typed value kinds (as for numpy dtypes: signed and unsigned
+# integers, and floats) and item sizes to data types
+kind_etypes = {
+    ('i', 1): 'miINT8',
+    ('u', 1): 'miUINT8',
+    ('i', 2): 'miINT16',
+    ('u', 2): 'miUINT16',
+    ('i', 4): 'miINT32',
+    ('u', 4): 'miUINT32',
+    ('i', 8): 'miINT64',
+    ('u', 8): 'miUINT64',
+    ('f', 4): 'miSINGLE',
+    ('f', 8): 'miDOUBLE'
+}
+
 # data types that may be used when writing numeric data
 compressed_numeric = ['miINT32', 'miUINT16', 'miINT16', 'miUINT8']
 
@@ -174,13 +195,35 @@ def write_elements(fd, mtp, data, is_name=False):
     # write data
     fd.write(struct.pack(fmt, *data))
 
+def write_array_elements(fd, mtp, values):
+    """Write data element tag and data, for an array of values supporting
+    the buffer protocol, e.g. an ``array.array`` of the data type mtp.
+
+    The data is written directly from the array buffer, without packing
+    the values one by one.
+    """
+    data = memoryview(values)
+    num_bytes = data.nbytes
+    # write tag: element type and number of bytes
+    fd.write(struct.pack('b3xI', etypes[mtp]['n'], num_bytes))
+    fd.write(data)
+    # add pad bytes, if needed
+    mod8 = num_bytes % 8
+    if mod8:
+        fd.write(b'\0' * (8 - mod8))
+
 def write_var_header(fd, header):
     """Write variable header"""
 
     # write tag bytes,
-    # and array flags + class and nzmax (null bytes)
+    # and array flags + class and nzmax
+    flag_class = mclasses[header['mclass']]
+    if header.get('is_logical'):
+        flag_class |= 1 << 9
+    if header.get('is_complex'):
+        flag_class |= 1 << 11
     fd.write(struct.pack('b3xI', etypes['miUINT32']['n'], 8))
-    fd.write(struct.pack('b3x4x', mclasses[header['mclass']]))
+    fd.write(struct.pack('II', flag_class, header.get('nzmax', 0)))
 
     # write dimensions array
     write_elements(fd, 'miINT32', header['dims'])
@@ -223,8 +266,41 @@ def write_numeric_array(fd, header, array):
         # list array data in column major order
         array = list(chain.from_iterable(izip(*array)))
 
-    # write matrix data to memory file
-    write_elements(bd, header['mtp'], array)
+    if header.get('is_complex'):
+        # write the real part, followed by the imaginary part
+        if isinstance(array, Sequence):
+            write_elements(bd, header['mtp'], [v.real for v in array])
+            write_elements(bd, header['mtp'], [v.imag for v in array])
+        else:
+            write_elements(bd, header['mtp'], array.real)
+            write_elements(bd, header['mtp'], array.imag)
+    else:
+        # write matrix data to memory file
+        write_elements(bd, header['mtp'], array)
+
+    # write the variable to disk file
+    data = bd.getvalue()
+    bd.close()
+    write_var_data(fd, data)
+
+def write_typed_array(fd, header, values):
+    """Write the numeric array, from a flat buffer of typed values in
+    column major order (the data of a ``NumericArray``, or a flattened
+    numpy array). Complex values are given as a pair of buffers, with the
+    real and imaginary parts."""
+    # make a memory file for writing array data
+    bd = BytesIO()
+
+    # write matrix header to memory file
+    write_var_header(bd, header)
+
+    # write matrix data to memory file, directly from the buffer
+    if header.get('is_complex'):
+        real, imag = values
+        write_array_elements(bd, header['mtp'], real)
+        write_array_elements(bd, header.get('imag_mtp', header['mtp']), imag)
+    else:
+        write_array_elements(bd, header['mtp'], values)
 
     # write the variable to disk file
     data = bd.getvalue()
@@ -294,20 +370,43 @@ def write_struct_array(fd, header, array):
     bd.close()
     write_var_data(fd, data)
 
+def write_sparse_array(fd, header, array):
+    """Write the sparse matrix: row indices (ir), column pointers (jc),
+    and values (pr)"""
+    # make a memory file for writing array data
+    bd = BytesIO()
+
+    # write matrix header to memory file
+    write_var_header(bd, header)
+
+    nnz = array.indptr[-1]
+    write_array_elements(bd, 'miINT32',
+                         typed_values(array.indices[:nnz], 'i'))
+    write_array_elements(bd, 'miINT32', typed_values(array.indptr, 'i'))
+    write_array_elements(bd, 'miDOUBLE',
+                         typed_values(array.data[:nnz], 'd'))
+
+    # write the variable to disk file
+    data = bd.getvalue()
+    bd.close()
+    write_var_data(fd, data)
+
 def write_char_array(fd, header, array):
     if isinstance(array, basestring):
-        # split string into chars
-        array = [asbytes(c) for c in array]
+        # split string into chars, encoded as UTF-8
+        array = [c.encode('utf-8') for c in array]
     else:
         # split each string in list into chars
-        array = [[asbytes(c) for c in s] for s in array]
+        array = [[c.encode('utf-8') for c in s] for s in array]
     return write_numeric_array(fd, header, array)
 
 def write_var_array(fd, array, name=''):
     """Write variable array (of any supported type)"""
     header, array = guess_header(array, name)
     mc = header['mclass']
-    if mc in numeric_class_etypes:
+    if header.get('is_typed'):
+        return write_typed_array(fd, header, array)
+    elif mc in numeric_class_etypes:
         return write_numeric_array(fd, header, array)
     elif mc == 'mxCHAR_CLASS':
         return write_char_array(fd, header, array)
@@ -315,6 +414,8 @@ def write_var_array(fd, array, name=''):
         return write_cell_array(fd, header, array)
     elif mc == 'mxSTRUCT_CLASS':
         return write_struct_array(fd, header, array)
+    elif mc == 'mxSPARSE_CLASS':
+        return write_sparse_array(fd, header, array)
     else:
         raise ValueError('Unknown mclass {}'.format(mc))
 
@@ -327,17 +428,101 @@ def isarray(array, test, dim=2):
                    for i in range(len(array)))
     return all(test(i) for i in array)
 
+def typecode_kind(typecode):
+    """Return the kind of values (as for numpy dtypes) of an
+    ``array.array`` type code."""
+    if typecode in 'fd':
+        return 'f'
+    return 'i' if typecode.islower() else 'u'
+
+def typed_header(kind, itemsize, dims, mclass=None, is_logical=False):
+    """Return the header for typed values of the given kind and item size,
+    e.g. from a ``NumericArray`` or a numpy array. The matrix class is
+    mclass, if given, or else the class of the data type."""
+    header = {'dims': dims, 'is_typed': True, 'is_logical': is_logical}
+    if kind == 'b':
+        # boolean values are saved as logical uint8 values
+        kind, header['is_logical'] = 'u', True
+    elif kind == 'c':
+        # complex values are saved as pairs of floats
+        kind, itemsize, header['is_complex'] = 'f', itemsize // 2, True
+    mtp = kind_etypes.get((kind, itemsize))
+    if mtp is None:
+        raise ValueError(
+            'Unsupported array data type (kind {!r}, item size {})'.format(
+                kind, itemsize))
+    if mclass is None:
+        mclass = etype_numeric_classes[mtp]
+    elif mclass not in numeric_class_etypes:
+        raise ValueError('Unsupported numeric array class {}'.format(mclass))
+    header.update({'mclass': mclass, 'mtp': mtp})
+    return header
+
 def guess_header(array, name=''):
     """Guess the array header information.
     Returns a header dict, with class, data type, and size information.
     """
     header = {}
 
+    if hasattr(array, 'tocsc') and not isinstance(array, SparseMatrix):
+        # SciPy sparse matrix
+        csc = array.tocsc()
+        csc.sort_indices()
+        array = SparseMatrix(csc.shape, csc.indices, csc.indptr, csc.data)
+
     if isinstance(array, Sequence) and len(array) == 1:
         # sequence with only one element, squeeze the array
         array = array[0]
 
-    if isinstance(array, basestring):
+    if isinstance(array, NumericArray):
+        header.update(typed_header(typecode_kind(array.typecode),
+                                   array.data.itemsize, tuple(array.dims),
+                                   array.mclass, array.is_logical))
+        if array.is_complex:
+            header['is_complex'] = True
+            if array.imag.typecode != array.typecode:
+                # the imaginary part is written with its own data type
+                header['imag_mtp'] = typed_header(
+                    typecode_kind(array.imag.typecode),
+                    array.imag.itemsize, header['dims'])['mtp']
+            array = (array.data, array.imag)
+        else:
+            array = array.data
+
+    elif hasattr(array, 'dtype') and hasattr(array, 'shape') and \
+            array.dtype.kind in 'biufc':
+        # numeric numpy array (or scalar), of any number of dimensions
+        # (numpy strings are str subclasses, and saved as strings)
+        dims = tuple(int(d) for d in array.shape)
+        if len(dims) == 0:
+            dims = (1, 1)
+        elif len(dims) == 1:
+            dims = (1, dims[0])
+        header.update(typed_header(array.dtype.kind, array.dtype.itemsize,
+                                   dims))
+        if not array.dtype.isnative:
+            array = array.astype(array.dtype.newbyteorder('='))
+        # flatten to a contiguous buffer, in column major order
+        array = array.ravel(order='F')
+        if header.get('is_complex'):
+            array = (array.real.copy(), array.imag.copy())
+
+    elif isinstance(array, SparseMatrix):
+        nnz = array.indptr[-1]
+        values = array.data[:nnz]
+        if hasattr(values, 'dtype'):
+            is_real = values.dtype.kind in 'biuf'
+        else:
+            is_real = not any(isinstance(v, complex) for v in values)
+        if not is_real:
+            raise ValueError('Only sparse matrices with real values are '
+                             'supported')
+        header.update({
+            'mclass': 'mxSPARSE_CLASS', 'dims': array.dims,
+            # Matlab requires space allocated for at least one value
+            'nzmax': max(nnz, 1)})
+
+    elif isinstance(array, basestring):
         header.update({
             'mclass': 'mxCHAR_CLASS', 'mtp': 'miUTF8',
             'dims': (1 if len(array) > 0 else 0, len(array))})
@@ -351,7 +536,7 @@ def guess_header(array, name=''):
         # test if cells (values) of all fields are of equal type and
         # have equal length
         field_types = [type(j) for j in array.values()]
-        field_lengths = [1 if isinstance(j, (basestring, int, float))
+        field_lengths = [1 if isinstance(j, (basestring, int, float, complex))
                          else len(j) for j in array.values()]
         if len(field_lengths) == 1:
             equal_lengths = True
@@ -381,6 +566,11 @@ def guess_header(array, name=''):
         header.update({
             'mclass': 'mxDOUBLE_CLASS', 'mtp': 'miDOUBLE', 'dims': (1, 1)})
 
+    elif isinstance(array, complex):
+        header.update({
+            'mclass': 'mxDOUBLE_CLASS', 'mtp': 'miDOUBLE', 'dims': (1, 1),
+            'is_complex': True})
+
     elif isinstance(array, Sequence):
 
         if isarray(array, lambda i: isinstance(i, int), 1):
@@ -400,6 +590,13 @@ def guess_header(array, name=''):
                 'mclass': 'mxDOUBLE_CLASS', 'mtp': 'miDOUBLE',
                 'dims': (1, len(array))})
 
+        elif isarray(array, lambda i: isinstance(i, (int, float, complex)),
+                     1):
+            # 1D complex array
+            header.update({
+                'mclass': 'mxDOUBLE_CLASS', 'mtp': 'miDOUBLE',
+                'dims': (1, len(array)), 'is_complex': True})
+
         elif (isarray(array, lambda i: isinstance(i, Sequence), 1) and
                 any(diff(len(s) for s in array))):
             # sequence of unequal length, assume cell array
@@ -441,8 +638,27 @@ def guess_header(array, name=''):
                     'mtp': 'miDOUBLE',
                     'dims': (len(array), len(array[0]))})
 
+            elif isarray(array, lambda i: isinstance(
+                    i, (int, float, complex))):
+                # 2D complex array
+                header.update({
+                    'mclass': 'mxDOUBLE_CLASS',
+                    'mtp': 'miDOUBLE',
+                    'dims': (len(array), len(array[0])),
+                    'is_complex': True})
+
+            else:
+                # numeric array with more than two dimensions, as nested
+                # lists (as loaded by loadmat)
+                try:
+                    array = NumericArray.from_lists(array)
+                except ValueError:
+                    pass
+                else:
+                    return guess_header(array, name)
+
         elif isarray(array, lambda i: isinstance(
-                i, (int, float, basestring, Sequence, Mapping))):
+                i, (int, float, complex, basestring, Sequence, Mapping))):
             # mixed contents, make it a cell array
             header.update({
                 'mclass': 'mxCELL_CLASS',
@@ -471,6 +687,19 @@ def savemat(filename, data):
 
     The parameter ``data`` shall be a dict with the variables.
 
+    Sparse matrices are saved from ``SparseMatrix`` objects, or from SciPy
+    sparse matrices, without creating a dense copy of the matrix. Sparse
+    matrices with complex values are not supported.
+
+    Numeric arrays of any number of dimensions are saved from
+    ``NumericArray`` objects, or from numpy arrays, keeping their data type.
+    The values are written directly from the array buffer. Numeric arrays
+    with more than two dimensions are also saved from uniformly nested lists,
+    see ``NumericArray.from_lists``.
+
+    Python ``complex`` values, and complex arrays, are saved as complex
+    Matlab arrays (with the real and imaginary parts stored separately).
+
     A ``ValueError`` exception is raised if data has invalid format, or if the
     data structure cannot be mapped to a known MAT array type.
     """
@@ -483,10 +712,31 @@ def savemat(filename, data):
     else:
         fd = filename
 
+    try:
+        write_mat(fd, data)
+    finally:
+        fd.close()
+
+
+def dumps(data):
+    """Save data in the MAT-file format, to bytes:
+
+    buffer = dumps(data)
+
+    The parameter ``data`` is as for ``savemat``.
+    """
+    fd = BytesIO()
+    write_mat(fd, data)
+    return fd.getvalue()
+
+
+def write_mat(fd, data):
+    """Write the file header, and the variables of dict data, to file fd."""
+    if not isinstance(data, Mapping):
+        raise ValueError('Data should be a dict of variable arrays')
+
     write_file_header(fd)
 
     # write variables
     for name, array in data.items():
         write_compressed_var_array(fd, array, name)
-
-    fd.close()
@@ -5,10 +5,24 @@ if sys.version_info[0] == 2:
     import unittest2 as unittest
 else:
     import unittest
+import array
 import json
 import os
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import scipy.io
+    import scipy.sparse
+except ImportError:
+    scipy = None
 
 import mat4py
+from mat4py import ParseError
 
 
 test_data = json.load(open('data/test_data.json'))
@@ -57,6 +71,799 @@ class TestSequenceFunctions(unittest.TestCase):
                     os.remove(tempname)
                 self.assertEqual(data, result)
 
+    def test_whosmat(self):
+        """Test listing variables in mat files"""
+        for filename, result in test_data['loadmat'].items():
+            with self.subTest(msg=filename):
+                variables = mat4py.whosmat('data/' + filename)
+                self.assertEqual([v['name'] for v in variables],
+                                 list(result.keys()))
+                for v in variables:
+                    self.assertTrue(v['is_compressed'])
+                    self.assertEqual(v['offset'], 128)
+                    self.assertEqual(len(v['dims']), 2)
+        variables = mat4py.whosmat('data/char_array.mat')
+        self.assertEqual(variables[0]['mclass'], 'mxCHAR_CLASS')
+        self.assertEqual(variables[0]['dims'], (2, 3))
+
+    def test_loadmat_variable_names(self):
+        """Test reading selected variables from a mat file"""
+        tempname = 'data/variable_names.mat.temp'
+        data = {'a': [1, 2, 3], 'b': 'text', 'c': {'x': 1.5}, 'd': 4}
+        try:
+            mat4py.savemat(tempname, data)
+            for names in (['c'], ['a', 'd'], ['d', 'e'], [], 'b'):
+                with self.subTest(msg=names):
+                    result = mat4py.loadmat(tempname, variable_names=names)
+                    if isinstance(names, str):
+                        names = [names]
+                    self.assertEqual(
+                        result, dict((k, data[k]) for k in names if k in data))
+        finally:
+            os.remove(tempname)
+
+    def test_matfile(self):
+        """Test lazy reading of variables using MatFile"""
+        tempname = 'data/matfile.mat.temp'
+        data = {'a': [1, 2, 3], 'b': 'text', 'c': {'x': 1.5}}
+        try:
+            mat4py.savemat(tempname, data)
+            with mat4py.MatFile(tempname) as mf:
+                self.assertEqual(list(mf), ['a', 'b', 'c'])
+                # membership tests do not load variables
+                self.assertIn('b', mf)
+                self.assertIn('b', mf.keys())
+                self.assertEqual(mf.cache, {})
+                self.assertEqual(mf['c'], data['c'])
+                self.assertEqual(mf['a'], data['a'])
+                self.assertIs(mf['c'], mf['c'])
+                self.assertNotIn('d', mf)
+                self.assertEqual(dict(mf), data)
+        finally:
+            os.remove(tempname)
+
+    def test_save_load_large(self):
+        """Test reading compressed data spanning many inflated chunks"""
+        tempname = 'data/large.mat.temp'
+        data = {
+            'a': [[(i * 7919 + j * 104729) % 1000003 for j in range(400)]
+                  for i in range(300)],
+            'b': 'end'}
+        try:
+            mat4py.savemat(tempname, data)
+            self.assertGreater(os.path.getsize(tempname), 64 * 1024)
+            self.assertEqual(mat4py.loadmat(tempname), data)
+            self.assertEqual(mat4py.loadmat(tempname, variable_names=['b']),
+                             {'b': 'end'})
+        finally:
+            os.remove(tempname)
+
+    def test_loadmat_array_backend(self):
+        """Test reading mat files with numeric arrays as NumericArray"""
+        def tolist(data):
+            if isinstance(data, mat4py.NumericArray):
+                return data.tolist()
+            if isinstance(data, dict):
+                return dict((k, tolist(v)) for k, v in data.items())
+            if isinstance(data, list):
+                return [tolist(v) for v in data]
+            return data
+
+        for filename, result in test_data['loadmat'].items():
+            with self.subTest(msg=filename):
+                data = mat4py.loadmat('data/' + filename, backend='array')
+                self.assertEqual(tolist(data), result)
+        data = mat4py.loadmat('data/bit_int_2d_array.mat', backend='array')
+        self.assertEqual(data['a'].dims, (2, 3))
+        self.assertEqual(data['a'].typecode, 'q')
+        self.assertEqual(list(data['a'].data),
+                         [0, 0, 2147483649, 2147483649, 4294967296, -1])
+        self.assertRaises(ValueError, mat4py.loadmat,
+                          'data/bit_int.mat', backend='unknown')
+
+    def test_save_load_array_class(self):
+        """Test keeping the class of arrays stored in other data types"""
+        from io import BytesIO
+        from mat4py.savemat import write_file_header, write_typed_array
+        fileobj = BytesIO()
+        write_file_header(fileobj)
+        # double and logical arrays, stored as uint8 values
+        write_typed_array(fileobj, {
+            'mclass': 'mxDOUBLE_CLASS', 'mtp': 'miUINT8', 'dims': (2, 2),
+            'name': 'x'}, array.array('B', [1, 2, 3, 4]))
+        write_typed_array(fileobj, {
+            'mclass': 'mxUINT8_CLASS', 'mtp': 'miUINT8', 'dims': (1, 3),
+            'name': 'b', 'is_logical': True}, array.array('B', [1, 0, 1]))
+        data = mat4py.loads(fileobj.getvalue(), backend='array')
+        for i in range(2):
+            self.assertEqual(data['x'].typecode, 'B')
+            self.assertEqual(data['x'].mclass, 'mxDOUBLE_CLASS')
+            self.assertFalse(data['x'].is_logical)
+            self.assertEqual(data['b'].mclass, 'mxUINT8_CLASS')
+            self.assertTrue(data['b'].is_logical)
+            buf = mat4py.dumps(data)
+            classes = dict((v['name'], v['mclass'])
+                           for v in mat4py.whosmat(BytesIO(buf)))
+            self.assertEqual(classes, {'x': 'mxDOUBLE_CLASS',
+                                       'b': 'mxUINT8_CLASS'})
+            data = mat4py.loads(buf, backend='array')
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_loadmat_numpy_backend(self):
+        """Test reading mat files with numeric arrays as NumPy arrays"""
+        def tolist(data):
+            if isinstance(data, numpy.ndarray):
+                return mat4py.NumericArray(
+                    data.ravel(order='F').tolist(), data.shape).tolist()
+            if isinstance(data, numpy.generic):
+                return data.item()
+            if isinstance(data, dict):
+                return dict((k, tolist(v)) for k, v in data.items())
+            if isinstance(data, list):
+                return [tolist(v) for v in data]
+            return data
+
+        for filename, result in test_data['loadmat'].items():
+            with self.subTest(msg=filename):
+                data = mat4py.loadmat('data/' + filename, backend='numpy')
+                self.assertEqual(tolist(data), result)
+        data = mat4py.loadmat('data/bit_int_2d_array.mat', backend='numpy')
+        self.assertEqual(data['a'].shape, (2, 3))
+        self.assertEqual(data['a'][1, 2], -1)
+        # arrays read from file are writable, whatever their size
+        from mat4py.savemat import write_file_header, write_typed_array
+        tempname = 'data/numpy_writable.mat.temp'
+        try:
+            for compressed in (True, False):
+                values = {'s': numpy.arange(10.0),
+                          'l': numpy.arange(100000.0)}
+                if compressed:
+                    mat4py.savemat(tempname, values)
+                else:
+                    with open(tempname, 'wb') as fileobj:
+                        write_file_header(fileobj)
+                        write_typed_array(fileobj, {
+                            'mclass': 'mxDOUBLE_CLASS', 'mtp': 'miDOUBLE',
+                            'dims': (1, 10), 'name': 's'}, values['s'])
+                data = mat4py.loadmat(tempname, backend='numpy')
+                for name in data:
+                    with self.subTest(compressed=compressed, name=name):
+                        self.assertTrue(data[name].flags.writeable)
+        finally:
+            os.remove(tempname)
+
+    def test_loadmat_column_order(self):
+        """Test reading numeric arrays as lists of columns"""
+        tempname = 'data/column_order.mat.temp'
+        data = {'a': [[1, 2, 3], [4, 5, 6]], 'b': [[1.5], [2.5]],
+                'c': [1, 2], 'd': 7}
+        try:
+            mat4py.savemat(tempname, data)
+            result = mat4py.loadmat(tempname, order='F')
+        finally:
+            os.remove(tempname)
+        self.assertEqual(result, {'a': [[1, 4], [2, 5], [3, 6]],
+                                  'b': [1.5, 2.5], 'c': [[1], [2]], 'd': 7})
+
+    def test_iter_variables(self):
+        """Test iterating over the variables in mat files"""
+        for filename, result in test_data['loadmat'].items():
+            with self.subTest(msg=filename):
+                meta = {}
+                data = list(mat4py.iter_variables('data/' + filename,
+                                                  meta=meta))
+                self.assertEqual(data, list(result.items()))
+                self.assertEqual(meta['__globals__'], [])
+                self.assertEqual(
+                    meta['__header__'],
+                    mat4py.loadmat('data/' + filename,
+                                   meta=True)['__header__'])
+
+    def test_loadmat_workers(self):
+        """Test reading mat files with parallel decompression"""
+        for filename, result in test_data['loadmat'].items():
+            with self.subTest(msg=filename):
+                data = mat4py.loadmat('data/' + filename, workers=4)
+                self.assertEqual(data, result)
+        tempname = 'data/workers.mat.temp'
+        data = dict(('v{}'.format(i), [i] * (i + 2)) for i in range(20))
+        try:
+            mat4py.savemat(tempname, data)
+            self.assertEqual(mat4py.loadmat(tempname, workers=3), data)
+            self.assertEqual(
+                mat4py.loadmat(tempname, variable_names=['v3', 'v17'],
+                               workers=2),
+                {'v3': data['v3'], 'v17': data['v17']})
+            # duplicate the variables in the file
+            with open(tempname, 'rb') as fileobj:
+                contents = fileobj.read()
+            with open(tempname, 'ab') as fileobj:
+                fileobj.write(contents[128:])
+            for workers in (None, 3):
+                with self.subTest(workers=workers):
+                    self.assertRaisesRegex(ParseError, 'Duplicate',
+                                           mat4py.loadmat, tempname,
+                                           workers=workers)
+        finally:
+            os.remove(tempname)
+
+    def test_loadmat_many(self):
+        """Test loading a batch of mat files in worker processes"""
+        filenames = sorted(test_data['loadmat'])
+        paths = ['data/' + f for f in filenames] + ['data/test_data.json']
+        for ordered in (True, False):
+            with self.subTest(ordered=ordered):
+                results = list(mat4py.loadmat_many(
+                    paths, workers=2, ordered=ordered, chunksize=3))
+                if not ordered:
+                    results.sort(key=lambda r: paths.index(r[0]))
+                self.assertEqual([r[0] for r in results], paths)
+                for filename, (path, data, error) in zip(filenames, results):
+                    self.assertIsNone(error)
+                    self.assertEqual(data, test_data['loadmat'][filename])
+                path, data, error = results[-1]
+                self.assertIsNone(data)
+                self.assertIsInstance(error, ParseError)
+
+    def test_loadmat_many_close(self):
+        """Test that few files are submitted when a batch is closed early"""
+        consumed = []
+
+        def paths():
+            for i in range(200):
+                consumed.append(i)
+                yield 'data/test_data.json'
+
+        for ordered in (True, False):
+            with self.subTest(ordered=ordered):
+                del consumed[:]
+                for result in mat4py.loadmat_many(
+                        paths(), workers=1, ordered=ordered, chunksize=1):
+                    break
+                self.assertLessEqual(len(consumed), 4)
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'requires Python 3.7')
+    def test_aio_save_load_mat(self):
+        """Test writing and reading mat files with the asyncio interface"""
+        import asyncio
+        import mat4py.aio
+        filenames = sorted(test_data['loadmat'])
+        tempnames = ['data/{}.temp'.format(f) for f in filenames]
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            semaphore = asyncio.Semaphore(2)
+            loop.run_until_complete(asyncio.gather(*[
+                mat4py.aio.savemat(t, test_data['loadmat'][f],
+                                   semaphore=semaphore)
+                for t, f in zip(tempnames, filenames)]))
+            results = loop.run_until_complete(asyncio.gather(*[
+                mat4py.aio.loadmat(t, semaphore=semaphore)
+                for t in tempnames]))
+        finally:
+            loop.close()
+            asyncio.set_event_loop(None)
+            for tempname in tempnames:
+                if os.path.exists(tempname):
+                    os.remove(tempname)
+        for filename, data in zip(filenames, results):
+            with self.subTest(msg=filename):
+                self.assertEqual(data, test_data['loadmat'][filename])
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'requires Python 3.7')
+    def test_aio_cancel(self):
+        """Test cancelling asyncio loading and saving of mat files"""
+        import asyncio
+        import mat4py.aio
+        tempname = 'data/aio_cancel.mat.temp'
+        data = {'v{}'.format(i): [[float(j) for j in range(300)]] * 100
+                for i in range(10)}
+
+        def run_cancelled(coro, fd, delay):
+            # the task is either cancelled or completed, the file closed
+            task = loop.create_task(coro)
+            loop.call_later(delay, task.cancel)
+            try:
+                loop.run_until_complete(task)
+            except asyncio.CancelledError:
+                pass
+            self.assertTrue(fd.closed)
+
+        loop = asyncio.new_event_loop()
+        try:
+            mat4py.savemat(tempname, data)
+            for i in range(20):
+                delay = i * 0.002
+                with self.subTest(delay=delay):
+                    fd = open(tempname, 'rb')
+                    run_cancelled(mat4py.aio.loadmat(fd), fd, delay)
+                    fd = open(tempname + '2', 'wb')
+                    run_cancelled(mat4py.aio.savemat(fd, data), fd, delay)
+        finally:
+            loop.close()
+            for name in (tempname, tempname + '2'):
+                if os.path.exists(name):
+                    os.remove(name)
+
+    def test_loadmat_slices(self):
+        """Test reading slices of numeric matrices"""
+        from mat4py.savemat import write_file_header, write_var_array
+        tempname = 'data/slices.mat.temp'
+        x = [[r * 10 + c for c in range(7)] for r in range(5)]
+        y = [[r * 0.5 + c for c in range(9)] for r in range(4)]
+        z = [[complex(r, c - 0.5) for c in range(7)] for r in range(5)]
+        tests = [
+            (None, slice(1, 3)),
+            (slice(1, 4), None),
+            (slice(4, 0, -2), slice(None, None, -3)),
+            (2, -1),
+            (slice(3, 3), None)]
+        try:
+            for compressed in (True, False):
+                if compressed:
+                    mat4py.savemat(tempname, {'x': x, 'y': y, 'z': z})
+                else:
+                    with open(tempname, 'wb') as fileobj:
+                        write_file_header(fileobj)
+                        write_var_array(fileobj, x, 'x')
+                        write_var_array(fileobj, y, 'y')
+                        write_var_array(fileobj, z, 'z')
+                for rows, cols in tests:
+                    with self.subTest(compressed=compressed, rows=rows,
+                                      cols=cols):
+                        rs = rows if isinstance(rows, slice) else (
+                            slice(rows, rows + 1 or None) if rows is not None
+                            else slice(None))
+                        cs = cols if isinstance(cols, slice) else (
+                            slice(cols, cols + 1 or None) if cols is not None
+                            else slice(None))
+                        expected = {}
+                        for name, value in (('x', x), ('z', z)):
+                            value = [row[cs] for row in value[rs]]
+                            if len(value) == 1:
+                                value = value[0]
+                                if len(value) == 1:
+                                    value = value[0]
+                            expected[name] = value
+                        data = mat4py.loadmat(tempname, slices={
+                            'x': (rows, cols), 'z': (rows, cols)})
+                        self.assertEqual(data, dict(expected, y=y))
+                        with mat4py.MatFile(tempname) as mf:
+                            for name in ('x', 'z'):
+                                self.assertEqual(
+                                    mf.read_slice(name, rows, cols),
+                                    expected[name])
+        finally:
+            os.remove(tempname)
+
+    def test_loadmat_sparse(self):
+        """Test reading sparse matrices"""
+        data = mat4py.loadmat('data/sparse_array.mat')
+        sparse = data['S']
+        self.assertIsInstance(sparse, mat4py.SparseMatrix)
+        self.assertEqual(sparse.dims, (4, 5))
+        self.assertEqual(sparse.nnz, 5)
+        self.assertEqual(list(sparse.indptr), [0, 1, 3, 3, 3, 5])
+        self.assertEqual(sparse.todok(), {
+            (1, 0): 2.0, (0, 1): 1.5, (3, 1): 4.0, (2, 4): -3.0,
+            (3, 4): 0.25})
+
+    def test_save_load_sparse(self):
+        """Test writing sparse matrices, and reading them again"""
+        sparse = mat4py.loadmat('data/sparse_array.mat')['S']
+        coo = mat4py.SparseMatrix.from_coo(
+            (3, 4), [2, 0, 1], [3, 0, 3], [1.0, 2.0, 3.0])
+        empty = mat4py.SparseMatrix.from_coo((2, 2), [], [], [])
+        self.assertEqual(list(coo.indptr), [0, 1, 1, 1, 3])
+        self.assertEqual(list(coo.indices), [0, 1, 2])
+        tempname = 'data/sparse.mat.temp'
+        try:
+            mat4py.savemat(tempname, {'a': sparse, 'b': coo, 'c': empty})
+            data = mat4py.loadmat(tempname)
+            if scipy is not None:
+                other = scipy.io.loadmat(tempname)
+                self.assertEqual((other['b'] != coo.toscipy()).nnz, 0)
+        finally:
+            os.remove(tempname)
+        self.assertEqual(data, {'a': sparse, 'b': coo, 'c': empty})
+
+    @unittest.skipIf(scipy is None, 'SciPy is not installed')
+    def test_save_scipy_sparse(self):
+        """Test writing SciPy sparse matrices"""
+        sparse = scipy.sparse.coo_matrix(
+            ([1.5, -2.0, 3.0], ([0, 2, 1], [1, 1, 3])), shape=(3, 5))
+        tempname = 'data/scipy_sparse.mat.temp'
+        try:
+            mat4py.savemat(tempname, {'s': sparse})
+            data = mat4py.loadmat(tempname)
+        finally:
+            os.remove(tempname)
+        self.assertEqual(data['s'].todok(),
+                         {(0, 1): 1.5, (2, 1): -2.0, (1, 3): 3.0})
+        # complex sparse matrices are not supported
+        sparse = scipy.sparse.csc_matrix([[1 + 2j, 0], [0, 3j]])
+        self.assertRaises(ValueError, mat4py.dumps, {'s': sparse})
+        sparse = mat4py.SparseMatrix((2, 2), [0, 1], [0, 1, 2], [1, 3j])
+        self.assertRaises(ValueError, mat4py.dumps, {'s': sparse})
+
+    def test_loadmat_nd(self):
+        """Test reading arrays with more than two dimensions"""
+        data = mat4py.loadmat('data/nd_array.mat')
+        self.assertEqual(len(data['a']), 2)
+        self.assertEqual(data['a'][1][2][3], 23.0)
+        self.assertEqual(data['a'][0][1], [2.0, 8.0, 14.0, 20.0])
+        self.assertEqual(data['b'][1][0][1][2], 12)
+        data = mat4py.loadmat('data/nd_array.mat', backend='array')
+        self.assertEqual(data['b'].dims, (2, 2, 2, 3))
+        self.assertEqual(list(data['b'].data[:8]),
+                         [-5, 7, 1, 13, -2, 10, 4, 16])
+        self.assertEqual(data['b'].tolist()[1][0][1][2], 12)
+        # squeezed in the same way as by the list backend
+        values = mat4py.NumericArray(array.array('d', [0, 1, 2]), (1, 1, 3))
+        self.assertEqual(values.tolist(), [[0.0, 1.0, 2.0]])
+        self.assertEqual(mat4py.loads(mat4py.dumps({'v': values}))['v'],
+                         values.tolist())
+        if numpy is not None:
+            data = mat4py.loadmat('data/nd_array.mat', backend='numpy')
+            self.assertEqual(data['a'].shape, (2, 3, 4))
+            self.assertEqual(data['a'][1, 2, 3], 23.0)
+            self.assertEqual(data['b'].dtype, numpy.int16)
+            self.assertEqual(data['b'][1, 0, 1, 2], 12)
+
+    def test_save_load_nd(self):
+        """Test writing typed and N-d arrays, and reading them again"""
+        nd = mat4py.loadmat('data/nd_array.mat', backend='array')
+        tempname = 'data/nd_array.mat.temp'
+        try:
+            mat4py.savemat(tempname, nd)
+            data = mat4py.loadmat(tempname, backend='array')
+        finally:
+            os.remove(tempname)
+        self.assertEqual(data, nd)
+        self.assertEqual(data['b'].typecode, 'h')
+        # nested lists, as loaded with the list backend
+        nd = mat4py.loadmat('data/nd_array.mat')
+        self.assertEqual(mat4py.loads(mat4py.dumps(nd)), nd)
+        values = mat4py.NumericArray.from_lists(nd['b'])
+        self.assertEqual(values.dims, (2, 2, 2, 3))
+        self.assertEqual(values.typecode, 'i')
+        self.assertEqual(values.tolist(), nd['b'])
+        self.assertRaises(ValueError, mat4py.NumericArray.from_lists,
+                          [[[1, 2], [3]], [[4, 5], [6, 7]]])
+        if numpy is not None:
+            values = {'x': numpy.arange(24, dtype='>u4').reshape((2, 3, 4)),
+                      'y': numpy.array([True, False, True]),
+                      'z': numpy.float32(1.5)}
+            try:
+                mat4py.savemat(tempname, values)
+                data = mat4py.loadmat(tempname, backend='numpy')
+            finally:
+                os.remove(tempname)
+            self.assertTrue((data['x'] == values['x']).all())
+            self.assertEqual(data['x'].dtype, numpy.uint32)
+            self.assertEqual(data['y'].tolist(), [[1, 0, 1]])
+            self.assertEqual(data['z'], 1.5)
+            # numpy strings are saved as strings
+            values = {'s': numpy.str_('abc'), 'c': ['a', numpy.str_('bc')]}
+            self.assertEqual(mat4py.loads(mat4py.dumps(values)), values)
+
+    def test_loadmat_complex(self):
+        """Test reading complex arrays"""
+        data = mat4py.loadmat('data/complex_array.mat')
+        self.assertEqual(data['z'], [[6j, 1 + 5j, 2 + 4j],
+                                     [3 + 3j, 4 + 2j, 5 + 1j]])
+        self.assertEqual(data['s'], 0.5 - 1.5j)
+        data = mat4py.loadmat('data/complex_array.mat', backend='array')
+        self.assertTrue(data['z'].is_complex)
+        self.assertEqual(list(data['z'].data), [0, 3, 1, 4, 2, 5])
+        self.assertEqual(list(data['z'].imag), [6, 3, 5, 2, 4, 1])
+        if numpy is not None:
+            data = mat4py.loadmat('data/complex_array.mat', backend='numpy')
+            self.assertEqual(data['z'].dtype, numpy.complex128)
+            self.assertEqual(data['z'][1, 2], 5 + 1j)
+
+    def test_save_load_complex(self):
+        """Test writing complex values and arrays, and reading them again"""
+        values = {'a': 1 - 2j, 'b': [1, 2j, 3.5], 'c': [[1j, 2], [3, 4 - 1j]]}
+        typed = mat4py.loadmat('data/complex_array.mat', backend='array')
+        tempname = 'data/complex.mat.temp'
+        try:
+            mat4py.savemat(tempname, values)
+            data = mat4py.loadmat(tempname)
+            mat4py.savemat(tempname, typed)
+            typed_data = mat4py.loadmat(tempname, backend='array')
+        finally:
+            os.remove(tempname)
+        self.assertEqual(data, values)
+        self.assertEqual(typed_data, typed)
+        if numpy is not None:
+            z = numpy.arange(8, dtype='complex64').reshape((2, 2, 2)) * 1j
+            try:
+                mat4py.savemat(tempname, {'z': z})
+                data = mat4py.loadmat(tempname, backend='numpy')
+            finally:
+                os.remove(tempname)
+            self.assertEqual(data['z'].dtype, numpy.complex64)
+            self.assertTrue((data['z'] == z).all())
+
+    def test_save_load_complex_mixed(self):
+        """Test complex arrays with parts stored in different data types"""
+        from io import BytesIO
+        from mat4py.savemat import write_file_header, write_typed_array
+        fileobj = BytesIO()
+        write_file_header(fileobj)
+        write_typed_array(fileobj, {
+            'mclass': 'mxDOUBLE_CLASS', 'mtp': 'miUINT8',
+            'imag_mtp': 'miINT16', 'is_complex': True, 'dims': (2, 2),
+            'name': 'z'}, (array.array('B', [1, 2, 3, 4]),
+                           array.array('h', [-300, 0, 5, 300])))
+        expected = [[1 - 300j, 3 + 5j], [2 + 0j, 4 + 300j]]
+        buf = fileobj.getvalue()
+        self.assertEqual(mat4py.loads(buf)['z'], expected)
+        typed = mat4py.loads(buf, backend='array')['z']
+        self.assertEqual(typed.typecode, 'd')
+        self.assertEqual(typed.imag.typecode, 'd')
+        self.assertEqual(typed.tolist(), expected)
+        # NumericArray parts of different types are written with their types
+        mixed = mat4py.NumericArray(array.array('B', [1, 2, 3, 4]), (2, 2),
+                                    array.array('h', [-300, 0, 5, 300]),
+                                    'mxDOUBLE_CLASS')
+        for value in (typed, mixed):
+            buf = mat4py.dumps({'z': value})
+            self.assertEqual(mat4py.loads(buf)['z'], expected)
+            if numpy is not None:
+                data = mat4py.loads(buf, backend='numpy')
+                self.assertEqual(data['z'].tolist(), expected)
+
+    def test_loadmat_columnar(self):
+        """Test reading struct arrays into columns"""
+        values = {'s': {'a': [1, 2, 3], 'b': [1.5, 2.5, -1.0],
+                        'c': ['x', 'yy', 'z'], 'd': [1, [1, 2], 3]}}
+        tempname = 'data/columnar.mat.temp'
+        try:
+            mat4py.savemat(tempname, values)
+            data = mat4py.loadmat(tempname, columnar=True)
+            if numpy is not None:
+                ndata = mat4py.loadmat(tempname, columnar=True,
+                                       backend='numpy')
+        finally:
+            os.remove(tempname)
+        s = data['s']
+        self.assertIsInstance(s, mat4py.StructColumns)
+        self.assertEqual(s.dims, (1, 3))
+        self.assertEqual(s['a'], array.array('i', [1, 2, 3]))
+        self.assertEqual(s['b'], array.array('d', [1.5, 2.5, -1.0]))
+        self.assertEqual(s['c'], ['x', 'yy', 'z'])
+        self.assertEqual(s.element(1), {'a': 2, 'b': 2.5, 'c': 'yy',
+                                        'd': [1, 2]})
+        self.assertEqual(s.todict(), values['s'])
+        if numpy is not None:
+            self.assertEqual(ndata['s']['b'].dtype, numpy.float64)
+            self.assertEqual(ndata['s']['b'].tolist(), [1.5, 2.5, -1.0])
+
+    def test_loadmat_cellstr(self):
+        """Test reading cell arrays of strings, and mixed cell arrays"""
+        labels = ['cat', 'dog', 'mouse', 'cat', 'mouse', 'cat']
+        values = {'labels': labels, 'empty': ['', 'a', ''],
+                  'mixed': ['abc', list(range(20000)), 'd', {'e': 'f'}],
+                  'nested': [['ab', 'c', 'x'], ['de', 'fgh']]}
+        tempname = 'data/cellstr.mat.temp'
+        try:
+            mat4py.savemat(tempname, values)
+            data = mat4py.loadmat(tempname)
+            interned = mat4py.loadmat(tempname, intern=True)
+        finally:
+            os.remove(tempname)
+        self.assertEqual(data, values)
+        self.assertEqual(interned, values)
+        self.assertIs(interned['labels'][0], interned['labels'][3])
+
+    def test_loadmat_utf16_chars(self):
+        """Test reading char arrays stored as miUINT16 (as by Matlab), and
+        writing and reading non-ASCII chars"""
+        from io import BytesIO
+        from mat4py.savemat import (write_file_header, write_var_header,
+                                    write_array_elements, write_var_data)
+
+        def write_chars(fd, rows, name=''):
+            bd = BytesIO()
+            write_var_header(bd, {'mclass': 'mxCHAR_CLASS', 'name': name,
+                                  'dims': (len(rows), len(rows[0]))})
+            chars = ''.join(''.join(col) for col in zip(*rows))
+            write_array_elements(bd, 'miUINT16',
+                                 array.array('H', [ord(c) for c in chars]))
+            write_var_data(fd, bd.getvalue())
+
+        tempname = 'data/utf16.mat.temp'
+        try:
+            with open(tempname, 'wb') as fileobj:
+                write_file_header(fileobj)
+                write_chars(fileobj, ['\u03a9mega'], 's')
+                write_chars(fileobj, ['abc', 'd\u20acf'], 'm')
+                bd = BytesIO()
+                write_var_header(bd, {'mclass': 'mxCELL_CLASS', 'name': 'c',
+                                      'dims': (1, 2)})
+                write_chars(bd, ['x\u00e9'])
+                write_chars(bd, ['yz\u20ac'])
+                write_var_data(fileobj, bd.getvalue())
+            data = mat4py.loadmat(tempname)
+            self.assertEqual(data, {'s': '\u03a9mega',
+                                    'm': ['abc', 'd\u20acf'],
+                                    'c': ['x\u00e9', 'yz\u20ac']})
+            mat4py.savemat(tempname, data)
+            self.assertEqual(mat4py.loadmat(tempname), data)
+        finally:
+            os.remove(tempname)
+
+    def test_loadmat_disk_cache(self):
+        """Test caching of loaded variables in a directory"""
+        import shutil
+        import tempfile
+        from mat4py.cache import DiskCache
+        directory = tempfile.mkdtemp()
+        try:
+            cache = DiskCache(directory)
+            data = mat4py.loadmat('data/struct_array.mat', cache=cache)
+            self.assertEqual(len(cache.entries()), len(data))
+            self.assertEqual(
+                mat4py.loadmat('data/struct_array.mat', cache=cache), data)
+            # other options are cached separately
+            mat4py.loadmat('data/struct_array.mat', order='F', cache=cache)
+            self.assertEqual(len(cache.entries()), 2 * len(data))
+            # least recently used values are evicted
+            cache = DiskCache(directory, max_bytes=cache.total_bytes // 2)
+            cache.set('key', 1)
+            self.assertEqual(cache.get('key'), 1)
+            self.assertLessEqual(cache.total_bytes, cache.max_bytes)
+            cache.clear()
+            self.assertEqual(cache.entries(), [])
+            # the cache directory is private to the user
+            subdirectory = os.path.join(directory, 'sub')
+            DiskCache(subdirectory)
+            if hasattr(os, 'getuid'):
+                self.assertEqual(os.stat(subdirectory).st_mode & 0o777,
+                                 0o700)
+                os.chmod(subdirectory, 0o777)
+                self.assertRaises(ValueError, DiskCache, subdirectory)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_variable_cache(self):
+        """Test caching of loaded variables in memory"""
+        from mat4py.cache import VariableCache
+        cache = VariableCache()
+        data = mat4py.loadmat('data/struct_array.mat', cache=cache)
+        self.assertEqual(cache.stats()['misses'], len(data))
+        again = mat4py.loadmat('data/struct_array.mat', cache=cache)
+        self.assertEqual(again, data)
+        with mat4py.MatFile('data/struct_array.mat', cache=cache) as mf:
+            for name in data:
+                self.assertEqual(mf[name], again[name])
+                self.assertIsNot(mf[name], again[name])
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 2 * len(data))
+        # modifying the loaded data does not affect the cache
+        again['s']['x'].append(5)
+        again['s'].clear()
+        self.assertEqual(
+            mat4py.loadmat('data/struct_array.mat', cache=cache), data)
+        self.assertEqual(stats['entries'], len(data))
+        # least recently used values are evicted
+        cache = VariableCache(max_bytes=1000)
+        cache.set('a', list(range(20)))
+        cache.set('b', list(range(20)))
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), list(range(20)))
+        self.assertEqual(cache.evictions, 1)
+        self.assertLessEqual(cache.total_bytes, 1000)
+
+    def test_index(self):
+        """Test writing and using sidecar index files"""
+        from mat4py.loadmat import read_index
+        from mat4py.savemat import write_file_header, write_var_array
+        tempname = 'data/index.mat.temp'
+        values = {'x': [[1, 2], [3, 4]], 'c': [[1, 2, 3], 'abc', [4.5, 5]],
+                  's': {'a': [1, 2], 'b': ['xy', 'z']}}
+        try:
+            with open(tempname, 'wb') as fileobj:
+                write_file_header(fileobj)
+                for name, value in values.items():
+                    write_var_array(fileobj, value, name)
+            with mat4py.MatFile(tempname) as mf:
+                self.assertEqual(mf.read_element('c', 1), 'abc')
+            path = mat4py.write_index(tempname)
+            self.assertEqual(path, tempname + '.matidx')
+            index = read_index(tempname)
+            self.assertEqual([v['name'] for v in index['variables']],
+                             list(values))
+            self.assertEqual(len(index['variables'][1]['elements']), 3)
+            self.assertEqual(index['variables'][2]['fields'], ['a', 'b'])
+            self.assertEqual(mat4py.loadmat(tempname), values)
+            self.assertEqual(mat4py.loadmat(tempname, variable_names=['s']),
+                             {'s': values['s']})
+            with mat4py.MatFile(tempname) as mf:
+                self.assertEqual(dict(mf), values)
+                self.assertEqual(mf.read_element('c', -1), [4.5, 5])
+                self.assertEqual(mf.read_element('s', 1, 'b'), 'z')
+            # the index is out of date, when the file is modified
+            stat = os.stat(tempname)
+            os.utime(tempname, (stat.st_atime, stat.st_mtime + 1))
+            self.assertIsNone(read_index(tempname))
+            self.assertEqual(mat4py.loadmat(tempname), values)
+        finally:
+            os.remove(tempname)
+            if os.path.exists(tempname + '.matidx'):
+                os.remove(tempname + '.matidx')
+
+    def test_loadmat_stream(self):
+        """Test reading from non-seekable streams"""
+        from io import BytesIO
+        from mat4py.loadmat import ForwardReader
+
+        class Stream(object):
+            # a stream returning short reads, and supporting no seek
+            def __init__(self, data):
+                self.fd = BytesIO(data)
+
+            def read(self, size):
+                return self.fd.read(min(size, 1000))
+
+            def seekable(self):
+                return False
+
+            def close(self):
+                pass
+
+        for filename in ('data/struct_array.mat', 'data/sparse_array.mat',
+                         'data/nd_array.mat'):
+            with open(filename, 'rb') as fileobj:
+                raw = fileobj.read()
+            with self.subTest(filename=filename):
+                self.assertEqual(
+                    mat4py.loadmat(Stream(raw), meta=True, workers=2),
+                    mat4py.loadmat(filename, meta=True))
+                self.assertEqual(
+                    [v['name'] for v in mat4py.whosmat(Stream(raw))],
+                    [v['name'] for v in mat4py.whosmat(filename)])
+        x = [[r * 10 + c for c in range(7)] for r in range(5)]
+        tempname = 'data/stream.mat.temp'
+        try:
+            mat4py.savemat(tempname, {'x': x, 'y': 1})
+            with open(tempname, 'rb') as fileobj:
+                raw = fileobj.read()
+        finally:
+            os.remove(tempname)
+        self.assertEqual(
+            mat4py.loadmat(Stream(raw), slices={'x': (1, slice(2, 4))}),
+            {'x': [12, 13], 'y': 1})
+        reader = ForwardReader(Stream(raw))
+        reader.seek(100)
+        self.assertEqual(reader.read(28), raw[100:128])
+        with self.assertRaises(ParseError):
+            reader.seek(120)
+
+    def test_loads_dumps(self):
+        """Test loading from, and saving to, bytes"""
+        from io import BytesIO
+        from mat4py.savemat import write_file_header, write_var_array
+        with open('data/struct_array.mat', 'rb') as fileobj:
+            raw = fileobj.read()
+        expected = mat4py.loadmat('data/struct_array.mat', meta=True)
+        for buffer in (raw, bytearray(raw), memoryview(raw)):
+            self.assertEqual(mat4py.loads(buffer, meta=True), expected)
+        values = {'x': [[1.5, 2], [3, 4]], 's': 'text', 'c': [[1, 2, 3], 'ab']}
+        self.assertEqual(mat4py.loads(mat4py.dumps(values)), values)
+        if numpy is not None:
+            # uncompressed numeric data is a view of the buffer
+            fileobj = BytesIO()
+            write_file_header(fileobj)
+            write_var_array(fileobj, values['x'], 'x')
+            buffer = bytearray(fileobj.getvalue())
+            x = mat4py.loads(buffer, backend='numpy')['x']
+            self.assertEqual(x.tolist(), values['x'])
+            buffer[-8:] = struct.pack('d', 5.0)
+            self.assertEqual(x[1, 1], 5.0)
+
 
 if __name__ == '__main__':
     unittest.main()